@@ -0,0 +1,146 @@
+import os
+import tempfile
+
+import numpy as np
+
+from gallery_matcher import ENCODING_DIM, best_matches
+
+# Number of inverted lists probed per query; higher is slower but closer to exact search
+DEFAULT_NPROBE = 8
+KMEANS_ITERATIONS = 20
+KMEANS_SAMPLES_PER_LIST = 64
+ASSIGN_CHUNK_ROWS = 4096  # Points per distance block when assigning to centroids; bounds peak memory
+IVF_INDEX_FILE = 'ivf.npz'
+
+
+def index_path_for(version_dir):
+    """Location of the IVF index inside an encoding store version directory."""
+    return os.path.join(version_dir, IVF_INDEX_FILE)
+
+
+def _sq_distances(queries, points, point_sq_norms):
+    dist = (np.einsum('ij,ij->i', queries, queries)[:, None] + point_sq_norms[None, :]
+            - 2.0 * (queries @ points.T))
+    return np.maximum(dist, 0.0, out=dist)
+
+
+def nearest_centroids(points, centroids, chunk_rows=ASSIGN_CHUNK_ROWS):
+    """Index of the closest centroid for every point, computed in blocks of rows."""
+    centroid_sq_norms = np.einsum('ij,ij->i', centroids, centroids)
+    assign = np.empty(len(points), dtype=np.int64)
+    for start in range(0, len(points), chunk_rows):
+        block = points[start:start + chunk_rows]
+        assign[start:start + len(block)] = np.argmin(_sq_distances(block, centroids, centroid_sq_norms), axis=1)
+    return assign
+
+
+def kmeans(points, nlist, iterations=KMEANS_ITERATIONS, seed=0):
+    """Plain Lloyd's k-means, trained on a sample of the points."""
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(points), nlist * KMEANS_SAMPLES_PER_LIST)
+    sample = points[rng.choice(len(points), sample_size, replace=False)]
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+
+    for _ in range(iterations):
+        assign = nearest_centroids(sample, centroids)
+        counts = np.bincount(assign, minlength=nlist)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, sample)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        # Re-seed empty lists from random sample points
+        if not filled.all():
+            centroids[~filled] = sample[rng.choice(len(sample), int((~filled).sum()), replace=False)]
+    return centroids
+
+
+class IVFIndex:
+    """Inverted-file (k-means partitioned) approximate nearest-neighbour index.
+
+    Each encoding is assigned to its closest centroid. A query only scans the
+    encodings of its `nprobe` closest centroids, trading a little recall for a
+    scan over roughly nprobe / nlist of the gallery. The match API is the same
+    as GalleryMatcher, so the recognizer can use either.
+    """
+
+    def __init__(self, centroids, embeddings, row_ids, list_offsets, nprobe=DEFAULT_NPROBE, version=None):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        self.row_ids = np.asarray(row_ids, dtype=np.int64)
+        self.list_offsets = np.asarray(list_offsets, dtype=np.int64)
+        self.centroid_sq_norms = np.einsum('ij,ij->i', self.centroids, self.centroids)
+        self.sq_norms = np.einsum('ij,ij->i', self.embeddings, self.embeddings)
+        self.nprobe = nprobe
+        self.version = version
+
+    @classmethod
+    def build(cls, encodings, student_ids, nlist=None, nprobe=DEFAULT_NPROBE, version=None, seed=0):
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_DIM)
+        student_ids = np.asarray(student_ids, dtype=np.int64).reshape(-1)
+        if nlist is None:
+            nlist = int(4 * np.sqrt(len(encodings)))
+        nlist = max(1, min(nlist, len(encodings)))
+
+        centroids = kmeans(encodings, nlist, seed=seed)
+        assign = nearest_centroids(encodings, centroids)
+        order = np.argsort(assign, kind='stable')
+        list_offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=nlist))])
+        return cls(centroids, encodings[order], student_ids[order], list_offsets, nprobe, version)
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    def __len__(self):
+        return len(self.embeddings)
+
+    def save(self, path):
+        # Unique temp name, so concurrent writers never interleave into one file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp.npz')
+        os.close(fd)
+        try:
+            np.savez(tmp_path, centroids=self.centroids, embeddings=self.embeddings, row_ids=self.row_ids,
+                     list_offsets=self.list_offsets, version=np.array(self.version or ''))
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path, nprobe=DEFAULT_NPROBE):
+        with np.load(path) as data:
+            return cls(data['centroids'], data['embeddings'], data['row_ids'], data['list_offsets'],
+                       nprobe=nprobe, version=str(data['version']) or None)
+
+    def _candidates(self, probe_lists):
+        return np.concatenate([np.arange(self.list_offsets[l], self.list_offsets[l + 1]) for l in probe_lists])
+
+    def match(self, face_encodings, k=1):
+        """Return, for every face, the k closest students as [(student_id, distance)]."""
+        queries = np.asarray(list(face_encodings), dtype=np.float32).reshape(-1, ENCODING_DIM)
+        if not len(queries) or not len(self.embeddings):
+            return [[] for _ in queries]
+
+        nprobe = min(self.nprobe, self.nlist)
+        centroid_dist = _sq_distances(queries, self.centroids, self.centroid_sq_norms)
+        probes = np.argpartition(centroid_dist, nprobe - 1, axis=1)[:, :nprobe]
+
+        results = []
+        for query, probe_lists in zip(queries, probes):
+            rows = self._candidates(probe_lists)
+            if not len(rows):
+                results.append([])
+                continue
+            dist = np.sqrt(_sq_distances(query[None, :], self.embeddings[rows], self.sq_norms[rows])[0])
+            # Closest encoding per student among the scanned rows
+            students, inverse = np.unique(self.row_ids[rows], return_inverse=True)
+            student_dist = np.full(len(students), np.inf, dtype=dist.dtype)
+            np.minimum.at(student_dist, inverse, dist)
+            top = np.argsort(student_dist)[:k]
+            results.append([(int(students[i]), float(student_dist[i])) for i in top])
+        return results
+
+    def best(self, face_encodings, threshold):
+        """Return (student_id, distance) per face; student_id is None above the threshold."""
+        return best_matches(self.match(face_encodings, k=1), threshold)
@@ -0,0 +1,174 @@
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+
+ATTENDANCE_BATCH_SIZE = 32  # Most writes committed in one transaction
+ATTENDANCE_BATCH_WAIT = 0.05  # Seconds to wait for more writes before committing a batch
+ATTENDANCE_MAX_RETRIES = 20  # Attempts per batch while the database is locked
+ATTENDANCE_RETRY_DELAY = 0.05  # Initial back-off in seconds, doubled per attempt (capped at 1s)
+
+_STOP = object()
+
+
+def _is_busy(error):
+    return 'locked' in str(error) or 'busy' in str(error)
+
+
+class AttendanceWriter:
+    """Background writer for attendance rows.
+
+    A single thread owns one SQLite connection in WAL mode, so readers (the
+    Flask app) do not block it and the capture loop never waits on a lock.
+    Writes are committed in small batches and retried while the database is
+    locked. Each call returns a Future: `log_in` resolves to the new attendance
+    ID (or None on failure), `log_out` to True/False.
+    """
+
+    def __init__(self, database, batch_size=ATTENDANCE_BATCH_SIZE, batch_wait=ATTENDANCE_BATCH_WAIT):
+        self.database = database
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self._queue = queue.Queue()
+        self.written = 0
+        self.failed = 0
+        self._thread = threading.Thread(target=self._run, name='attendance-writer', daemon=True)
+        self._thread.start()
+
+    def log_in(self, student_id, when=None):
+        """Queue a new attendance row (starttime set, endtime empty)."""
+        future = Future()
+        self._queue.put(('in', student_id, when or datetime.now(), future))
+        return future
+
+    def log_out(self, attendance, when=None):
+        """Queue setting the endtime; `attendance` is an ID or the Future returned by log_in."""
+        future = Future()
+        self._queue.put(('out', attendance, when or datetime.now(), future))
+        return future
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def close(self, timeout=None):
+        """Flush all queued writes and stop the writer thread."""
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def _connect(self):
+        """Open the connection in WAL mode, retrying while the database is locked."""
+        delay = ATTENDANCE_RETRY_DELAY
+        for attempt in range(ATTENDANCE_MAX_RETRIES):
+            conn = sqlite3.connect(self.database, timeout=1.0)
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                return conn
+            except sqlite3.OperationalError as e:
+                conn.close()
+                if not _is_busy(e):
+                    raise
+                time.sleep(delay)
+                delay = min(delay * 2, 1.0)
+        raise sqlite3.OperationalError("database is locked")
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.batch_wait
+        while batch[-1] is not _STOP and len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=max(0.0, remaining)) if remaining > 0
+                             else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        conn = None
+        try:
+            while True:
+                batch = self._next_batch()
+                stop = batch[-1] is _STOP
+                ops = [op for op in batch if op is not _STOP]
+                try:
+                    if ops:
+                        # (Re)connect lazily so a database locked at startup only fails this batch
+                        if conn is None:
+                            conn = self._connect()
+                        self._write_batch(conn, ops)
+                except Exception as e:
+                    # Never let the thread die: resolve the batch as failed and keep serving
+                    if conn is not None:
+                        try:
+                            conn.rollback()
+                        except sqlite3.Error:
+                            conn.close()
+                            conn = None
+                    self._fail(ops, e)
+                if stop:
+                    break
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def _write_batch(self, conn, ops):
+        delay = ATTENDANCE_RETRY_DELAY
+        for attempt in range(ATTENDANCE_MAX_RETRIES):
+            try:
+                results = self._execute(conn, ops)
+                conn.commit()
+                break
+            except sqlite3.OperationalError as e:
+                conn.rollback()
+                if not _is_busy(e):
+                    return self._fail(ops, e)
+                time.sleep(delay)
+                delay = min(delay * 2, 1.0)
+            except sqlite3.Error as e:
+                conn.rollback()
+                return self._fail(ops, e)
+        else:
+            return self._fail(ops, sqlite3.OperationalError("database is locked"))
+
+        for (kind, target, when, future), result in zip(ops, results):
+            if kind == 'in':
+                print(f"Attendance logged in for student ID {target} at {when} with attendance ID {result}")
+            elif result:
+                print(f"Attendance logged out for attendance ID {self._resolve(target, {})} at {when}")
+            future.set_result(result)
+        self.written += len(ops)
+
+    def _resolve(self, target, batch_ids):
+        if isinstance(target, Future):
+            if target in batch_ids:
+                return batch_ids[target]
+            return target.result() if target.done() else None
+        return target
+
+    def _execute(self, conn, ops):
+        cursor = conn.cursor()
+        batch_ids = {}  # IDs of rows inserted earlier in this batch, by their Future
+        results = []
+        for kind, target, when, future in ops:
+            if kind == 'in':
+                cursor.execute("INSERT INTO attendance (student_id, starttime) VALUES (?, ?)", (target, when))
+                batch_ids[future] = cursor.lastrowid
+                results.append(cursor.lastrowid)
+            else:
+                attendance_id = self._resolve(target, batch_ids)
+                if attendance_id is None:
+                    results.append(False)
+                    continue
+                cursor.execute("UPDATE attendance SET endtime = ? WHERE id = ?", (when, attendance_id))
+                results.append(True)
+        return results
+
+    def _fail(self, ops, error):
+        print(f"Failed to write {len(ops)} attendance record(s): {error}")
+        self.failed += len(ops)
+        for kind, target, when, future in ops:
+            if not future.done():
+                future.set_result(None if kind == 'in' else False)
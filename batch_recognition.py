@@ -0,0 +1,247 @@
+"""Headless recognition over recorded video files and image directories.
+
+Runs the same preprocess / detect / encode / match path as the kiosk, spread
+over several processes, and writes one row per recognised face to a CSV or
+JSON-lines file and/or the attendance table.
+
+    python batch_recognition.py footage/*.mp4 snapshots/ --output results.csv --workers 4
+"""
+import argparse
+import csv
+import json
+import os
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from multiprocessing import Pool
+
+import cv2
+
+import encoding_store
+from ann_index import DEFAULT_NPROBE
+from attendance_writer import AttendanceWriter
+from image_recognition import (DATABASE, LOGOUT_AFTER, SCALE_FACTOR, init_worker_process, load_matcher,
+                               preprocess_image, recognize_faces)
+
+VIDEO_EXTENSIONS = {'.mp4', '.avi', '.mov', '.mkv', '.mpg', '.mpeg', '.wmv'}
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.bmp'}
+SEGMENT_FRAMES = 1500  # Frames per work unit when splitting a video by time range
+IMAGES_PER_UNIT = 200  # Images per work unit when splitting a directory
+RESULT_FIELDS = ['source', 'frame', 'offset', 'student_id', 'distance', 'top', 'right', 'bottom', 'left']
+
+
+def plan_work(inputs, segment_frames=SEGMENT_FRAMES, images_per_unit=IMAGES_PER_UNIT):
+    """Split the inputs into independent units: video frame ranges or image batches."""
+    units = []
+    for path in inputs:
+        if os.path.isdir(path):
+            images = sorted(os.path.join(path, name) for name in os.listdir(path)
+                            if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS)
+            for start in range(0, len(images), images_per_unit):
+                units.append(('images', path, images[start:start + images_per_unit]))
+        elif os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS:
+            units.append(('images', os.path.dirname(path), [path]))
+        elif os.path.splitext(path)[1].lower() in VIDEO_EXTENSIONS:
+            cap = cv2.VideoCapture(path)
+            frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            cap.release()
+            if frame_count <= 0:
+                # Unknown length (some containers); process the file as a single unit
+                units.append(('video', path, (0, None)))
+                continue
+            for start in range(0, frame_count, segment_frames):
+                units.append(('video', path, (start, min(start + segment_frames, frame_count))))
+        else:
+            print(f"Skipping unsupported input {path}")
+    return units
+
+
+def _iter_video(path, start, end, frame_step):
+    cap = cv2.VideoCapture(path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    if start:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    index = start
+    try:
+        while end is None or index < end:
+            if (index - start) % frame_step:
+                # grab() skips decoding into a NumPy array
+                if not cap.grab():
+                    break
+            else:
+                success, img = cap.read()
+                if not success:
+                    break
+                yield index, index / fps, img
+            index += 1
+    finally:
+        cap.release()
+
+
+def _iter_images(paths):
+    for index, path in enumerate(paths):
+        img = cv2.imread(path)
+        if img is None:
+            print(f"Failed to load image {path}")
+            continue
+        yield index, 0.0, img, path
+
+
+_matcher = None
+_matcher_error = None
+
+
+def _init_worker(store_dir, index, nprobe):
+    global _matcher, _matcher_error
+    init_worker_process()
+    try:
+        _matcher = load_matcher(store_dir, index, nprobe)
+    except (Exception, SystemExit) as e:
+        # An initializer that raises makes Pool restart workers forever; fail the units instead
+        _matcher_error = e
+
+
+def process_unit(unit, frame_step=1):
+    """Run recognition over one work unit; returns (result rows, frames processed, seconds spent)."""
+    if _matcher is None:
+        raise RuntimeError(f"worker could not load the encodings: {_matcher_error!r}")
+    start = time.perf_counter()
+    kind, source, span = unit
+    if kind == 'video':
+        frames = ((index, offset, img, source) for index, offset, img in _iter_video(source, *span, frame_step))
+    else:
+        frames = _iter_images(span)
+
+    rows = []
+    processed = 0
+    for index, offset, img, frame_source in frames:
+        imgS = preprocess_image(img, SCALE_FACTOR)
+        faceCurFrame, matches = recognize_faces(imgS, _matcher)
+        processed += 1
+        for (top, right, bottom, left), (student_id, distance) in zip(faceCurFrame, matches):
+            rows.append({
+                'source': frame_source,
+                'frame': index,
+                'offset': round(offset, 3),
+                'student_id': student_id,
+                'distance': round(distance, 4),
+                # Boxes in original image coordinates
+                'top': int(top / SCALE_FACTOR), 'right': int(right / SCALE_FACTOR),
+                'bottom': int(bottom / SCALE_FACTOR), 'left': int(left / SCALE_FACTOR),
+            })
+    return rows, processed, time.perf_counter() - start
+
+
+def _process_unit_star(args):
+    return process_unit(*args)
+
+
+class ResultWriter:
+    """Writes result rows as CSV or JSON lines depending on the file extension."""
+
+    def __init__(self, path):
+        self.file = open(path, 'w', newline='')
+        self.jsonl = path.endswith(('.jsonl', '.json'))
+        if not self.jsonl:
+            self.csv = csv.DictWriter(self.file, fieldnames=RESULT_FIELDS)
+            self.csv.writeheader()
+
+    def write(self, rows):
+        for row in rows:
+            if self.jsonl:
+                self.file.write(json.dumps(row) + '\n')
+            else:
+                self.csv.writerow(row)
+
+    def close(self):
+        self.file.close()
+
+
+def write_attendance(rows, start_time=None, logout_after=LOGOUT_AFTER):
+    """Turn sightings into attendance rows: one session per student per gap of `logout_after` seconds.
+
+    Video sightings are timed from `start_time` (default: the file's modification
+    time); still images use their own modification time.
+    """
+    sightings = defaultdict(list)  # {student_id: [datetime]}
+    for row in rows:
+        if row['student_id'] is None:
+            continue
+        is_image = os.path.splitext(row['source'])[1].lower() in IMAGE_EXTENSIONS
+        base = (start_time if start_time and not is_image
+                else datetime.fromtimestamp(os.path.getmtime(row['source'])))
+        sightings[row['student_id']].append(base + timedelta(seconds=row['offset']))
+
+    writer = AttendanceWriter(DATABASE)
+    sessions = 0
+    try:
+        for student_id, times in sightings.items():
+            times.sort()
+            session_start = previous = times[0]
+            for seen in times[1:] + [None]:
+                if seen is None or (seen - previous).total_seconds() > logout_after:
+                    writer.log_out(writer.log_in(student_id, session_start), previous)
+                    sessions += 1
+                    session_start = seen
+                previous = seen
+    finally:
+        writer.close()
+    return sessions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline face recognition over video files and image directories")
+    parser.add_argument('inputs', nargs='+', help="video files, image files or directories of images")
+    parser.add_argument('--output', help="results file (.csv, or .jsonl for JSON lines)")
+    parser.add_argument('--attendance', action='store_true', help="also write sessions to the attendance table")
+    parser.add_argument('--start-time', type=datetime.fromisoformat,
+                        help="wall-clock time of the first video frame (default: file modification time)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--frame-step', type=int, default=1, help="process every Nth video frame")
+    parser.add_argument('--segment-frames', type=int, default=SEGMENT_FRAMES,
+                        help="video frames per work unit; smaller spreads long videos over more cores")
+    parser.add_argument('--index', choices=['exact', 'ivf'], default='exact')
+    parser.add_argument('--nprobe', type=int, default=DEFAULT_NPROBE)
+    args = parser.parse_args()
+
+    if not args.output and not args.attendance:
+        parser.error("nothing to do: pass --output and/or --attendance")
+
+    # Open the encodings here first: a missing store exits with an error before any
+    # worker starts, and a missing IVF index is built once instead of once per worker
+    load_matcher(encoding_store.STORE_DIR, args.index, args.nprobe)
+
+    units = plan_work(args.inputs, args.segment_frames)
+    print(f"Processing {len(units)} work units from {len(args.inputs)} inputs on {args.workers} workers.")
+
+    writer = ResultWriter(args.output) if args.output else None
+    all_rows = []
+    total_frames = 0
+    busy_seconds = 0.0  # Time workers spent processing units, summed over workers
+    start = time.perf_counter()
+    initargs = (encoding_store.STORE_DIR, args.index, args.nprobe)
+    with Pool(args.workers, initializer=_init_worker, initargs=initargs) as pool:
+        tasks = [(unit, args.frame_step) for unit in units]
+        for rows, processed, unit_seconds in pool.imap_unordered(_process_unit_star, tasks):
+            total_frames += processed
+            busy_seconds += unit_seconds
+            if writer:
+                writer.write(rows)
+            if args.attendance:
+                all_rows.extend(row for row in rows if row['student_id'] is not None)
+    elapsed = time.perf_counter() - start
+    if writer:
+        writer.close()
+
+    if args.attendance:
+        sessions = write_attendance(all_rows, args.start_time)
+        print(f"Wrote {sessions} attendance sessions.")
+
+    fps = total_frames / elapsed if elapsed else 0.0
+    worker_fps = total_frames / busy_seconds if busy_seconds else 0.0
+    print(f"Processed {total_frames} frames in {elapsed:.1f}s: {fps:.1f} frames/s "
+          f"({worker_fps:.1f} frames/s per busy worker).")
+
+
+if __name__ == "__main__":
+    main()
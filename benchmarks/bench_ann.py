@@ -0,0 +1,71 @@
+"""Recall vs. latency of the IVF index against exact search.
+
+Recall is the fraction of queries where the IVF index makes the same decision
+as the exact matcher at ENCODING_DISTANCE_THRESHOLD: the same student, or
+"unknown" for both.
+
+Usage: python benchmarks/bench_ann.py [--size 50000] [--nprobe 1 2 4 8 16 32]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ann_index import IVFIndex  # noqa: E402
+from gallery_matcher import GalleryMatcher  # noqa: E402
+
+# Same value as image_recognition.ENCODING_DISTANCE_THRESHOLD (not imported to avoid the cv2 dependency)
+ENCODING_DISTANCE_THRESHOLD = 0.45
+
+
+def synthetic_people(num_students, images_per_student=3, seed=0):
+    """Clustered encodings: ~0.9 between people, ~0.3 between images of one person."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(scale=0.056, size=(num_students, 128))
+    encodings = np.repeat(centers, images_per_student, axis=0)
+    encodings += rng.normal(scale=0.019, size=encodings.shape)
+    student_ids = np.repeat(np.arange(num_students), images_per_student)
+    return centers, encodings, student_ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=50000, help='gallery encodings')
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--unknown', type=float, default=0.2, help='fraction of queries of unenrolled people')
+    parser.add_argument('--nlist', type=int, default=None)
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    centers, encodings, student_ids = synthetic_people(args.size // 3)
+    known = centers[rng.choice(len(centers), args.queries, replace=True)]
+    num_unknown = int(args.queries * args.unknown)
+    known[:num_unknown] = rng.normal(scale=0.056, size=(num_unknown, 128))
+    queries = known + rng.normal(scale=0.019, size=known.shape)
+
+    exact = GalleryMatcher(encodings, student_ids)
+    start = time.perf_counter()
+    truth = [exact.best([q], ENCODING_DISTANCE_THRESHOLD)[0][0] for q in queries]
+    exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    start = time.perf_counter()
+    index = IVFIndex.build(encodings, student_ids, nlist=args.nlist)
+    print(f"gallery={len(encodings)} nlist={index.nlist} build={time.perf_counter() - start:.1f}s")
+    print(f"{'search':>10} {'recall':>8} {'ms/face':>8} {'speedup':>8}")
+    print(f"{'exact':>10} {1.0:>8.3f} {exact_ms:>8.3f} {1.0:>7.1f}x")
+
+    for nprobe in args.nprobe:
+        index.nprobe = nprobe
+        start = time.perf_counter()
+        found = [index.best([q], ENCODING_DISTANCE_THRESHOLD)[0][0] for q in queries]
+        ivf_ms = (time.perf_counter() - start) * 1000 / len(queries)
+        recall = np.mean([a == b for a, b in zip(found, truth)])
+        print(f"{'ivf/' + str(nprobe):>10} {recall:>8.3f} {ivf_ms:>8.3f} {exact_ms / ivf_ms:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
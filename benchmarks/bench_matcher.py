@@ -0,0 +1,63 @@
+"""Compare the per-face linear scan used before with the batched GalleryMatcher.
+
+Usage: python benchmarks/bench_matcher.py [--sizes 1000 10000 100000] [--faces 3]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from gallery_matcher import GalleryMatcher  # noqa: E402
+
+
+def synthetic_gallery(size, images_per_student=3, seed=0):
+    """Random unit-scale 128-d encodings, a few per student."""
+    rng = np.random.default_rng(seed)
+    encodings = rng.normal(scale=0.09, size=(size, 128))
+    student_ids = np.arange(size) // images_per_student
+    return encodings, student_ids
+
+
+def linear_scan(encodings, student_ids, faces):
+    """The old main loop: 3x duplicated gallery, one face_distance per face."""
+    known = np.repeat(encodings, 3, axis=0)
+    known_ids = np.repeat(student_ids, 3)
+    results = []
+    for face in faces:
+        face_dis = np.linalg.norm(known - face, axis=1)  # face_recognition.face_distance
+        match_index = np.argmin(face_dis)
+        results.append((known_ids[match_index], face_dis[match_index]))
+    return results
+
+
+def timed(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--faces', type=int, default=3, help='faces per frame')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'gallery':>8} {'linear ms':>10} {'batched ms':>11} {'speedup':>8}")
+    for size in args.sizes:
+        encodings, student_ids = synthetic_gallery(size)
+        faces = encodings[:args.faces] + 0.01
+        matcher = GalleryMatcher(encodings, student_ids)
+        linear = timed(lambda: linear_scan(encodings, student_ids, faces), args.repeat)
+        batched = timed(lambda: matcher.match(faces, k=1), args.repeat)
+        print(f"{size:>8} {linear * 1000:>10.2f} {batched * 1000:>11.2f} {linear / batched:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""Compare two benchmark result files and flag regressions.
+
+Usage: python benchmarks/compare.py baseline.json candidate.json [--threshold 0.10]
+
+Exits with status 1 if any benchmark's median got slower by more than the
+threshold, so it can gate CI.
+"""
+import argparse
+import json
+import sys
+
+
+def load(path):
+    with open(path) as file:
+        report = json.load(file)
+    return report['meta'], {result['name']: result for result in report['results']}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=0.10, help="allowed relative slowdown of the median")
+    args = parser.parse_args()
+
+    base_meta, baseline = load(args.baseline)
+    cand_meta, candidate = load(args.candidate)
+    print(f"baseline {base_meta.get('commit')} vs candidate {cand_meta.get('commit')}")
+    print(f"{'benchmark':<32} {'baseline ms':>12} {'candidate ms':>13} {'change':>8}")
+
+    regressions = []
+    for name in sorted(set(baseline) | set(candidate)):
+        if name not in baseline or name not in candidate:
+            print(f"{name:<32} {'only in ' + ('candidate' if name in candidate else 'baseline'):>34}")
+            continue
+        before, after = baseline[name]['median'], candidate[name]['median']
+        change = (after - before) / before if before else 0.0
+        flag = ''
+        if change > args.threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print(f"{name:<32} {before:>12.3f} {after:>13.3f} {change:>+8.1%}{flag}")
+
+    if regressions:
+        print(f"{len(regressions)} regression(s) above {args.threshold:.0%}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
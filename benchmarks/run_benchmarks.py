@@ -0,0 +1,265 @@
+"""Stage-level benchmark suite with synthetic galleries and frames.
+
+Times each stage of the system separately and writes machine-readable JSON
+so runs can be compared across commits with benchmarks/compare.py:
+
+    python benchmarks/run_benchmarks.py --output bench-$(git rev-parse --short HEAD).json
+    python benchmarks/compare.py bench-old.json bench-new.json
+
+Frames are synthetic (noise plus a smooth gradient), so detection and
+encoding timings reflect the cost of the models, not recognition accuracy.
+Stages whose dependencies are missing are recorded as skipped.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+FRAME_SHAPE = (480, 640, 3)  # Camera resolution set by the kiosk
+DEFAULT_GALLERY_SIZES = [100, 1000, 10000, 100000]
+
+
+def synthetic_frame(seed=0, shape=FRAME_SHAPE):
+    """A camera-sized BGR frame: smooth gradient plus noise."""
+    rng = np.random.default_rng(seed)
+    gradient = np.linspace(0, 200, shape[1], dtype=np.float32)[None, :, None]
+    noise = rng.normal(0, 20, size=shape)
+    return np.clip(gradient + noise, 0, 255).astype(np.uint8)
+
+
+def synthetic_gallery(size, images_per_student=3, seed=0):
+    """`size` encodings for size / images_per_student students (rounded up)."""
+    rng = np.random.default_rng(seed)
+    encodings = rng.normal(scale=0.056, size=(size, 128))
+    student_ids = np.arange(size) // images_per_student + 1
+    return encodings, student_ids
+
+
+def measure(func, iterations, warmup=1):
+    """Run func repeatedly and return per-call timings in milliseconds."""
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def summarize(name, timings, **extra):
+    timings = sorted(timings)
+    return dict({
+        'name': name,
+        'unit': 'ms',
+        'iterations': len(timings),
+        'median': statistics.median(timings),
+        'mean': statistics.fmean(timings),
+        'p95': timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        'min': timings[0],
+    }, **extra)
+
+
+def create_database(path, students=1000):
+    """Create the Flask app's tables with synthetic students."""
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE student (id INTEGER PRIMARY KEY, name TEXT, emp TEXT, age INTEGER,
+                              department TEXT, gmail TEXT, star INTEGER);
+        CREATE TABLE image (id INTEGER PRIMARY KEY, image_filename TEXT, image_type TEXT, student_id INTEGER);
+        CREATE TABLE attendance (id INTEGER PRIMARY KEY, student_id INTEGER, starttime DATETIME, endtime DATETIME);
+    """)
+    conn.executemany("INSERT INTO student VALUES (?, ?, ?, ?, ?, ?, ?)",
+                     [(i, f"Student {i}", f"EMP{i:05d}", 30, "Engineering", f"s{i}@example.com", 1 + i % 5)
+                      for i in range(1, students + 1)])
+    conn.executemany("INSERT INTO image (image_filename, image_type, student_id) VALUES (?, 'front', ?)",
+                     [(f"{i}_front.jpg", i) for i in range(1, students + 1)])
+    conn.commit()
+    conn.close()
+
+
+def bench_preprocess(args):
+    from image_recognition import SCALE_FACTOR, preprocess_image
+    frame = synthetic_frame()
+    yield summarize('preprocess_image', measure(lambda: preprocess_image(frame, SCALE_FACTOR), args.iterations * 10))
+
+
+def bench_detection(args):
+    import face_recognition
+    from image_recognition import SCALE_FACTOR, preprocess_image
+    imgS = preprocess_image(synthetic_frame(), SCALE_FACTOR)
+    yield summarize('detect.hog', measure(lambda: face_recognition.face_locations(imgS, model='hog'), args.iterations))
+
+
+def bench_encoding(args):
+    import face_recognition
+    from image_recognition import SCALE_FACTOR, preprocess_image
+    imgS = preprocess_image(synthetic_frame(), SCALE_FACTOR)
+    for faces in (1, 3):
+        boxes = [(20, 40 + 35 * i, 60, 10 + 35 * i) for i in range(faces)]
+        yield summarize(f'encode.faces_{faces}',
+                        measure(lambda: face_recognition.face_encodings(imgS, boxes), args.iterations), faces=faces)
+
+
+def bench_matching(args):
+    from ann_index import IVFIndex
+    from gallery_matcher import GalleryMatcher
+    for size in args.gallery_sizes:
+        encodings, student_ids = synthetic_gallery(size)
+        faces = encodings[:3] + 0.01
+        students = int(student_ids[-1])
+        matcher = GalleryMatcher(encodings, student_ids)
+        # Named by encoding count, which is what matching cost scales with
+        yield summarize(f'match.exact.{size}', measure(lambda: matcher.best(faces, 0.45), args.iterations),
+                        encodings=size, students=students, faces=len(faces))
+        if size >= 10000:
+            index = IVFIndex.build(encodings, student_ids)
+            yield summarize(f'match.ivf.{size}', measure(lambda: index.best(faces, 0.45), args.iterations),
+                            encodings=size, students=students, faces=len(faces), nprobe=index.nprobe)
+
+
+def bench_student_info(args, workdir):
+    import image_recognition
+    from student_cache import StudentCache
+    image_recognition.DATABASE = os.path.join(workdir, 'students.db')
+    create_database(image_recognition.DATABASE)
+    ids = iter(range(10 ** 9))
+    yield summarize('get_student_info.uncached',
+                    measure(lambda: image_recognition.get_student_info(1 + next(ids) % 1000), args.iterations * 10))
+    cache = StudentCache(image_recognition.get_student_info, lambda student_id: None)
+    yield summarize('get_student_info.cached',
+                    measure(lambda: cache.get_info(1 + next(ids) % 10), args.iterations * 10))
+
+
+def bench_attendance(args, workdir):
+    from attendance_writer import AttendanceWriter
+    database = os.path.join(workdir, 'attendance.db')
+    create_database(database, students=10)
+    # The writer logs every row; keep that out of the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        writer = AttendanceWriter(database)
+        try:
+            # Enqueue cost is what the capture thread pays
+            enqueue = measure(lambda: writer.log_out(writer.log_in(1)), args.iterations * 10)
+            # Round trip until the row is committed (includes the batching window)
+            commit = measure(lambda: writer.log_in(1).result(), args.iterations)
+        finally:
+            writer.close()
+    yield summarize('attendance.enqueue', enqueue)
+    yield summarize('attendance.commit', commit)
+
+
+def bench_render(args):
+    from image_recognition import display_student_info
+    background = synthetic_frame(shape=(720, 1280 + 40, 3))
+    banner = synthetic_frame(seed=1, shape=(657, 1313, 3))
+    photo = synthetic_frame(seed=2, shape=(300, 300, 3))
+    info = {'id': 1, 'name': 'Student 1', 'emp': 'EMP00001', 'age': 30,
+            'department': 'Engineering', 'gmail': 's1@example.com', 'star': 4}
+
+    def render():
+        img = background.copy()
+        display_student_info(img, info, photo, banner)
+
+    yield summarize('display_student_info', measure(render, args.iterations * 5))
+
+    from render_cache import RenderCache
+    cache = RenderCache(background)
+    key = ('student', tuple(info.items()), id(photo))
+    # Steady state: the same student stays on screen, so the composed frame is reused
+    yield summarize('display_student_info.cached',
+                    measure(lambda: cache.get(key, lambda img: display_student_info(img, info, photo, banner)),
+                            args.iterations * 5))
+
+
+def bench_enrollment(args):
+    from encoding_pool import EncodingPool
+    images = [synthetic_frame(seed=i) for i in range(args.enrollment_images)]
+    for workers in sorted({1, args.workers}):
+        with EncodingPool(workers) as pool:
+            timings = measure(lambda: pool.encode_images(images), max(1, args.iterations // 5))
+        yield summarize(f'encode_images.workers_{workers}', timings,
+                        images=len(images), per_image=statistics.median(timings) / len(images))
+
+
+STAGES = {
+    'preprocess': bench_preprocess,
+    'detection': bench_detection,
+    'encoding': bench_encoding,
+    'matching': bench_matching,
+    'student_info': bench_student_info,
+    'attendance': bench_attendance,
+    'render': bench_render,
+    'enrollment': bench_enrollment,
+}
+NEEDS_WORKDIR = {'student_info', 'attendance'}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--stages', nargs='+', choices=sorted(STAGES), default=list(STAGES))
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--gallery-sizes', type=int, nargs='+', default=DEFAULT_GALLERY_SIZES,
+                        help='gallery sizes in encodings (3 per student) for the matching stage')
+    parser.add_argument('--enrollment-images', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--output', default='benchmark_results.json')
+    args = parser.parse_args()
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'numpy': np.__version__,
+        },
+        'results': [],
+        'skipped': {},
+    }
+    workdir = tempfile.mkdtemp(prefix='bench-')
+    try:
+        for stage in args.stages:
+            bench = STAGES[stage]
+            try:
+                results = bench(args, workdir) if stage in NEEDS_WORKDIR else bench(args)
+                for result in results:
+                    result['stage'] = stage
+                    report['results'].append(result)
+                    print(f"{result['name']:<32} median {result['median']:>10.3f} ms   p95 {result['p95']:>10.3f} ms")
+            except ImportError as e:
+                report['skipped'][stage] = f"missing dependency: {e}"
+                print(f"{stage:<32} skipped ({e})")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f"Wrote {len(report['results'])} results to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+import hashlib
+import os
+import pickle
+
+# Default location of the per-image encoding cache (next to EncodeFile.p)
+CACHE_FILE = 'EncodeCache.p'
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """Return the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def settings_fingerprint(settings):
+    """Return a stable fingerprint of the preprocessing settings dictionary."""
+    return hashlib.sha256(repr(sorted(settings.items())).encode('utf-8')).hexdigest()
+
+
+class EncodingCache:
+    """Persistent per-image encoding cache keyed by image content hash.
+
+    Entries are only valid for the preprocessing settings they were computed
+    with, so a cache file written with different settings is discarded on load.
+    A value of None records that no face was found in the image.
+    """
+
+    def __init__(self, cache_path=CACHE_FILE, settings=None):
+        self.cache_path = cache_path
+        self.fingerprint = settings_fingerprint(settings or {})
+        self.entries = {}  # {image digest: encoding or None}
+        self.reused = 0
+        self.recomputed = 0
+        self.dropped = 0
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, 'rb') as file:
+                data = pickle.load(file)
+        except Exception as e:
+            print(f"Ignoring unreadable encoding cache {self.cache_path}: {e}")
+            return
+        if not isinstance(data, dict) or data.get('fingerprint') != self.fingerprint:
+            print("Encoding settings changed, rebuilding encoding cache.")
+            return
+        self.entries = data.get('entries', {})
+
+    def lookup(self, digest):
+        """Return (hit, encoding) for an image digest and count the reuse."""
+        if digest in self.entries:
+            self.reused += 1
+            return True, self.entries[digest]
+        return False, None
+
+    def store(self, digest, encoding):
+        self.entries[digest] = encoding
+        self.recomputed += 1
+
+    def prune(self, live_digests):
+        """Drop entries for images that are no longer part of the gallery."""
+        stale = [digest for digest in self.entries if digest not in live_digests]
+        for digest in stale:
+            del self.entries[digest]
+        self.dropped += len(stale)
+        return len(stale)
+
+    def save(self):
+        """Write the cache atomically so a crash never leaves a truncated file."""
+        tmp_path = f"{self.cache_path}.tmp"
+        try:
+            with open(tmp_path, 'wb') as file:
+                pickle.dump({'fingerprint': self.fingerprint, 'entries': self.entries}, file)
+            os.replace(tmp_path, self.cache_path)
+        except Exception as e:
+            print(f"Error saving encoding cache: {e}")
+
+    def stats(self):
+        return {'reused': self.reused, 'recomputed': self.recomputed, 'dropped': self.dropped}
@@ -0,0 +1,187 @@
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import cv2
+import face_recognition
+
+# Number of encoder processes; defaults to one per core
+ENCODING_WORKERS = int(os.environ.get('ENCODING_WORKERS', os.cpu_count() or 1))
+
+
+def parse_detector_cascade(spec):
+    """Parse "hog:0,hog:1,cnn:1" into (('hog', 0), ('hog', 1), ('cnn', 1))."""
+    cascade = []
+    for step in spec.split(','):
+        model, _, upsample = step.strip().partition(':')
+        if model not in ('hog', 'cnn'):
+            raise ValueError(f"unknown face detector {model!r} in {spec!r}")
+        cascade.append((model, int(upsample or 0)))
+    return tuple(cascade)
+
+
+# Detectors tried in order until one finds a face: HOG is fast on a CPU, upsampling
+# finds smaller faces, and CNN (slow without a GPU) is only the last resort, upsampled once
+# like the previous always-CNN detector so it finds every face that one did
+DETECTOR_CASCADE = parse_detector_cascade(os.environ.get('ENCODING_DETECTORS', 'hog:0,hog:1,cnn:1'))
+
+# Preprocessing and detection settings used for enrollment images (part of the cache key)
+ENCODING_SETTINGS = {
+    'scale': 0.25,
+    'clahe_clip_limit': 2.0,
+    'clahe_tile_grid': 8,
+    'denoise_h': 30,
+    'denoise_template_window': 7,
+    'denoise_search_window': 21,
+    'detector_cascade': DETECTOR_CASCADE,
+}
+
+# Outcome of encoding one image: the encoding (or None), why it failed (or None),
+# the cascade step that found the face (e.g. 'hog:1', or None) and the seconds spent detecting
+EncodeResult = namedtuple('EncodeResult', ['encoding', 'error', 'detector', 'detect_seconds'],
+                          defaults=(None, None))
+
+# Failure reasons that describe the image itself rather than a transient error
+NO_FACE = 'no face found'
+NO_LANDMARKS = 'no facial landmarks found'
+
+
+def detect_face_cascade(img_rgb, cascade):
+    """Run the detectors in order; returns (face locations, detector used, seconds)."""
+    start = time.perf_counter()
+    for model, upsample in cascade:
+        face_locations = face_recognition.face_locations(img_rgb, number_of_times_to_upsample=upsample, model=model)
+        if face_locations:
+            return face_locations, f"{model}:{upsample}", time.perf_counter() - start
+    return [], None, time.perf_counter() - start
+
+
+def encode_image(img, settings=ENCODING_SETTINGS):
+    """Encode the first face found in a BGR image and return an EncodeResult."""
+    # Resize image to reduce processing time and memory usage
+    small_img = cv2.resize(img, (0, 0), fx=settings['scale'], fy=settings['scale'])
+
+    # Convert to grayscale for contrast adjustment
+    gray_img = cv2.cvtColor(small_img, cv2.COLOR_BGR2GRAY)
+
+    # Apply CLAHE (Contrast Limited Adaptive Histogram Equalization) to improve local contrast
+    grid = settings['clahe_tile_grid']
+    clahe = cv2.createCLAHE(clipLimit=settings['clahe_clip_limit'], tileGridSize=(grid, grid))
+    equalized_img = clahe.apply(gray_img)
+
+    # Apply denoising to remove noise and artifacts that could affect recognition
+    denoised_img = cv2.fastNlMeansDenoising(equalized_img, None, settings['denoise_h'],
+                                            settings['denoise_template_window'],
+                                            settings['denoise_search_window'])
+
+    # Convert back to RGB after contrast improvement and denoising; dlib's
+    # detectors and encoder only accept 8-bit images, so the values stay 0-255
+    img_rgb = cv2.cvtColor(denoised_img, cv2.COLOR_GRAY2RGB)
+
+    # Cheapest detector first, falling back to slower ones only when it finds nothing
+    face_locations, detector, detect_seconds = detect_face_cascade(img_rgb, settings['detector_cascade'])
+    if not face_locations:
+        return EncodeResult(None, NO_FACE, None, detect_seconds)
+
+    # Encode the face using the detected face locations; the encoder predicts the
+    # landmarks it needs itself, so there is no separate face_landmarks pass
+    encodings = face_recognition.face_encodings(img_rgb, known_face_locations=face_locations)
+    if not encodings:
+        return EncodeResult(None, NO_LANDMARKS, detector, detect_seconds)
+
+    # Keep the first encoding, assuming one face per image
+    return EncodeResult(encodings[0], None, detector, detect_seconds)
+
+
+_worker_settings = ENCODING_SETTINGS
+
+
+def _init_worker(settings):
+    """Per-process setup: run once when a worker starts, not once per image."""
+    global _worker_settings
+    _worker_settings = settings
+    # Each worker owns one core; stop OpenCV from spawning its own thread pool
+    cv2.setNumThreads(1)
+    # face_recognition loads the dlib models on import; touch them so the cost
+    # is paid at startup rather than on the first image
+    face_recognition.api.face_detector
+    face_recognition.api.pose_predictor_68_point
+    face_recognition.api.face_encoder
+
+
+def _encode_path(path):
+    try:
+        img = cv2.imread(path)
+        if img is None:
+            return EncodeResult(None, f"failed to load image {path}")
+        return encode_image(img, _worker_settings)
+    except Exception as e:
+        return EncodeResult(None, f"{type(e).__name__}: {e}")
+
+
+def _encode_array(img):
+    try:
+        return encode_image(img, _worker_settings)
+    except Exception as e:
+        return EncodeResult(None, f"{type(e).__name__}: {e}")
+
+
+class EncodingPool:
+    """Process pool that encodes enrollment images in parallel.
+
+    Results are returned in input order as EncodeResult tuples. The worker
+    processes are started on first use and reused for later rebuilds.
+    """
+
+    def __init__(self, workers=ENCODING_WORKERS, settings=ENCODING_SETTINGS):
+        self.workers = max(1, int(workers))
+        self.settings = settings
+        self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(self.settings,),
+            )
+        return self._executor
+
+    def _map(self, func, items):
+        items = list(items)
+        if not items:
+            return []
+        if self.workers == 1:
+            # Only when configured: dlib holds the GIL, so encoding here blocks the Flask threads
+            global _worker_settings
+            _worker_settings = self.settings
+            return [func(item) for item in items]
+        chunksize = max(1, len(items) // (self.workers * 4))
+        try:
+            return list(self._get_executor().map(func, items, chunksize=chunksize))
+        except BrokenProcessPool:
+            # A worker died (OOM, crash on a bad image); fail this call, start a fresh pool next time
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            raise
+
+    def encode_paths(self, paths):
+        """Load and encode image files; workers read the files themselves."""
+        return self._map(_encode_path, paths)
+
+    def encode_images(self, images):
+        """Encode already loaded BGR images."""
+        return self._map(_encode_array, images)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
@@ -0,0 +1,52 @@
+import threading
+
+import encoding_store
+
+RELOAD_CHECK_INTERVAL = 2.0  # Seconds between checks of the store's CURRENT pointer
+
+
+class MatcherReloader:
+    """Keep a matcher in sync with the encoding store without blocking its users.
+
+    A background thread polls the store's CURRENT pointer. When a new version
+    is published it builds the new matcher on that thread and then replaces
+    `self.current`, a (version_dir, matcher) pair, with a single attribute
+    assignment. Readers that need both should read `current` once, so the
+    version they see always belongs to the matcher they use.
+    """
+
+    def __init__(self, loader, store_dir=encoding_store.STORE_DIR, interval=RELOAD_CHECK_INTERVAL):
+        self._loader = loader  # callable returning a matcher for the live store version
+        self.store_dir = store_dir
+        self.interval = interval
+        self.current = (encoding_store.current_version_dir(store_dir), loader())
+        self.reloads = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='encoding-reloader', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                version_dir = encoding_store.current_version_dir(self.store_dir)
+                if version_dir is None or version_dir == self.version_dir:
+                    continue
+                print(f"New encoding store version {version_dir}, reloading in the background.")
+                matcher = self._loader()
+                self.current = (version_dir, matcher)
+                self.reloads += 1
+            except Exception as e:
+                # Keep serving the current matcher and retry on the next check
+                print(f"Failed to reload encodings: {e}")
+
+    @property
+    def version_dir(self):
+        return self.current[0]
+
+    @property
+    def matcher(self):
+        return self.current[1]
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=self.interval + 1)
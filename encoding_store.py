@@ -0,0 +1,164 @@
+"""Versioned, memory-mappable on-disk store for the known face encodings.
+
+Layout of a store directory:
+
+    EncodeStore/
+        CURRENT              name of the live version directory, e.g. "v000012"
+        v000012/
+            embeddings.npy   float32 (N, 128), rows grouped by student
+            ids.npy          int64 (N,), student ID of each row
+            norms.npy        float32 (N,), squared norm of each row
+            meta.json        format, version, digest, count, dim, created_at
+            ivf.npz          IVF index over the same rows, if BUILD_IVF_INDEX (see ann_index.py)
+
+Writers build a new version directory and then atomically replace CURRENT,
+so readers either see the previous complete version or the new one. Readers
+open the arrays with mmap, which takes effectively no time or memory up front.
+
+Convert an old pickle file with:
+
+    python encoding_store.py EncodeFile.p EncodeStore
+"""
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import shutil
+from collections import namedtuple
+from datetime import datetime
+
+import numpy as np
+
+from ann_index import IVFIndex, index_path_for
+from gallery_matcher import GalleryMatcher
+
+STORE_DIR = 'EncodeStore'
+FORMAT_VERSION = 1
+CURRENT_FILE = 'CURRENT'
+EMBEDDINGS_FILE = 'embeddings.npy'
+IDS_FILE = 'ids.npy'
+NORMS_FILE = 'norms.npy'
+META_FILE = 'meta.json'
+KEEP_VERSIONS = 2  # the live version plus the previous one for readers still using it
+# Build ivf.npz with every version; only worth it for deployments running `--index ivf`, which
+# otherwise build a missing index themselves on first load
+BUILD_IVF_INDEX = os.environ.get('BUILD_IVF_INDEX', '0') == '1'
+
+StoredEncodings = namedtuple('StoredEncodings', ['embeddings', 'student_ids', 'sq_norms', 'meta', 'path'])
+
+
+def current_version_dir(root=STORE_DIR):
+    """Return the directory of the live version, or None if the store is empty."""
+    try:
+        with open(os.path.join(root, CURRENT_FILE)) as file:
+            name = file.read().strip()
+    except FileNotFoundError:
+        return None
+    return os.path.join(root, name) if name else None
+
+
+def open_store(root=STORE_DIR):
+    """Memory-map the live version of the store; returns None if there is none."""
+    version_dir = current_version_dir(root)
+    if version_dir is None:
+        return None
+    with open(os.path.join(version_dir, META_FILE)) as file:
+        meta = json.load(file)
+    if meta.get('format') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported encoding store format {meta.get('format')} in {version_dir}")
+    embeddings = np.load(os.path.join(version_dir, EMBEDDINGS_FILE), mmap_mode='r')
+    student_ids = np.load(os.path.join(version_dir, IDS_FILE), mmap_mode='r')
+    sq_norms = np.load(os.path.join(version_dir, NORMS_FILE), mmap_mode='r')
+    return StoredEncodings(embeddings, student_ids, sq_norms, meta, version_dir)
+
+
+def load_matcher(stored):
+    """Wrap a StoredEncodings in a GalleryMatcher without copying the arrays."""
+    return GalleryMatcher.from_grouped(stored.embeddings, stored.student_ids, stored.sq_norms)
+
+
+def _version_dirs(root):
+    return sorted(name for name in os.listdir(root)
+                  if name.startswith('v') and name[1:].isdigit() and os.path.isdir(os.path.join(root, name)))
+
+
+def _save_array(path, array):
+    with open(path, 'wb') as file:
+        np.save(file, array)
+        file.flush()
+        os.fsync(file.fileno())
+
+
+def write_store(encodings, student_ids, root=STORE_DIR, build_index=BUILD_IVF_INDEX):
+    """Write a new version of the store and make it live atomically; returns its metadata."""
+    os.makedirs(root, exist_ok=True)
+
+    # Deduplicate and group rows by student once here, so readers can use the arrays as-is
+    matcher = GalleryMatcher(encodings, student_ids)
+    digest = hashlib.sha256(matcher.embeddings.tobytes() + matcher.row_ids.tobytes()).hexdigest()[:12]
+
+    existing = _version_dirs(root)
+    version = int(existing[-1][1:]) + 1 if existing else 1
+    name = f"v{version:06d}"
+    version_dir = os.path.join(root, name)
+    tmp_dir = f"{version_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    meta = {
+        'format': FORMAT_VERSION,
+        'version': version,
+        'digest': digest,
+        'count': len(matcher),
+        'students': matcher.num_students,
+        'dim': int(matcher.embeddings.shape[1]),
+        'grouped': True,
+        'created_at': datetime.now().isoformat(),
+    }
+    _save_array(os.path.join(tmp_dir, EMBEDDINGS_FILE), matcher.embeddings)
+    _save_array(os.path.join(tmp_dir, IDS_FILE), matcher.row_ids)
+    _save_array(os.path.join(tmp_dir, NORMS_FILE), matcher.sq_norms)
+    with open(os.path.join(tmp_dir, META_FILE), 'w') as file:
+        json.dump(meta, file, indent=2)
+    if build_index:
+        # Build the IVF index before the version goes live, so `--index ivf` readers
+        # never see a version without one; they rebuild it themselves if this fails
+        try:
+            IVFIndex.build(matcher.embeddings, matcher.row_ids, version=digest).save(index_path_for(tmp_dir))
+        except Exception as e:
+            print(f"Error building ANN index: {e}")
+    os.rename(tmp_dir, version_dir)
+
+    # Swap the CURRENT pointer in one rename
+    current_tmp = os.path.join(root, f"{CURRENT_FILE}.tmp")
+    with open(current_tmp, 'w') as file:
+        file.write(name)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(current_tmp, os.path.join(root, CURRENT_FILE))
+
+    for old in _version_dirs(root)[:-KEEP_VERSIONS]:
+        shutil.rmtree(os.path.join(root, old), ignore_errors=True)
+
+    meta['path'] = version_dir
+    return meta
+
+
+def convert_pickle(pickle_path, root=STORE_DIR):
+    """Import an old [encodeListKnown, studentIds] pickle file into the store."""
+    with open(pickle_path, 'rb') as file:
+        encodeListKnownWithIds = pickle.load(file)
+    if len(encodeListKnownWithIds) != 2:
+        raise ValueError("Invalid encoding file format. Should contain [encodeListKnown, studentIds].")
+    encodeListKnown, studentIds = encodeListKnownWithIds
+    return write_store(encodeListKnown, studentIds, root)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert an EncodeFile.p pickle into the binary encoding store")
+    parser.add_argument('pickle_path', nargs='?', default='EncodeFile.p')
+    parser.add_argument('store_dir', nargs='?', default=STORE_DIR)
+    args = parser.parse_args()
+    meta = convert_pickle(args.pickle_path, args.store_dir)
+    print(f"Wrote {meta['count']} encodings for {meta['students']} students to {meta['path']}")
@@ -0,0 +1,104 @@
+import itertools
+
+REENCODE_INTERVAL = 2.0  # Seconds before a tracked face is re-encoded and re-matched anyway
+MIN_TRACK_IOU = 0.3  # Minimum box overlap to continue a track from the previous frame
+CONFIDENT_TRACK_IOU = 0.6  # Below this overlap the face moved a lot; re-encode to be safe
+MAX_MISSED_FRAMES = 3  # Frames a track survives without a matching detection
+
+
+def box_iou(a, b):
+    """Intersection over union of two (top, right, bottom, left) boxes."""
+    top, right = max(a[0], b[0]), min(a[1], b[1])
+    bottom, left = min(a[2], b[2]), max(a[3], b[3])
+    inter = max(0, right - left) * max(0, bottom - top)
+    if not inter:
+        return 0.0
+    area_a = (a[1] - a[3]) * (a[2] - a[0])
+    area_b = (b[1] - b[3]) * (b[2] - b[0])
+    return inter / float(area_a + area_b - inter)
+
+
+class Track:
+    """One face followed across frames."""
+
+    def __init__(self, track_id, box):
+        self.id = track_id
+        self.box = box
+        self.iou = 0.0  # overlap with the previous frame's box; 0 for a new track
+        self.match = None  # (student_id, distance) from the last encoding
+        self.encoded_at = None
+        self.missed = 0
+
+    def needs_encoding(self, now, interval):
+        return (self.match is None or self.iou < CONFIDENT_TRACK_IOU
+                or now - self.encoded_at >= interval)
+
+
+class FaceTracker:
+    """IoU-based multi-face tracker that decides which faces need re-encoding.
+
+    Detections are associated greedily with the existing track they overlap
+    most. A track is only re-encoded when it is new, when its match is older
+    than `reencode_interval`, or when the box jumped (low IoU) so the identity
+    may have changed. Otherwise its last match is reused.
+    """
+
+    def __init__(self, reencode_interval=REENCODE_INTERVAL):
+        self.reencode_interval = reencode_interval
+        self.tracks = []
+        self._ids = itertools.count(1)
+        self.encoded = 0
+        self.reused = 0
+
+    def update(self, face_locations):
+        """Associate this frame's detections with tracks; returns one Track per detection."""
+        pairs = sorted(((box_iou(track.box, box), t, d)
+                        for t, track in enumerate(self.tracks)
+                        for d, box in enumerate(face_locations)), reverse=True)
+        assigned = {}
+        used_tracks = set()
+        for iou, t, d in pairs:
+            if iou < MIN_TRACK_IOU:
+                break
+            if t in used_tracks or d in assigned:
+                continue
+            assigned[d] = t
+            used_tracks.add(t)
+
+        result = []
+        for d, box in enumerate(face_locations):
+            if d in assigned:
+                track = self.tracks[assigned[d]]
+                track.iou = box_iou(track.box, box)
+                track.box = box
+                track.missed = 0
+            else:
+                track = Track(next(self._ids), box)
+            result.append(track)
+
+        # Keep unmatched tracks for a few frames so a missed detection doesn't reset them
+        survivors = []
+        for t, track in enumerate(self.tracks):
+            if t not in used_tracks:
+                track.missed += 1
+                if track.missed <= MAX_MISSED_FRAMES:
+                    survivors.append(track)
+        self.tracks = result + survivors
+        return result
+
+    def to_encode(self, tracks, now):
+        """Split tracks into those needing a fresh encoding and count the reuse."""
+        stale = [track for track in tracks if track.needs_encoding(now, self.reencode_interval)]
+        self.encoded += len(stale)
+        self.reused += len(tracks) - len(stale)
+        return stale
+
+    def set_matches(self, tracks, matches, now):
+        for track, match in zip(tracks, matches):
+            track.match = match
+            track.encoded_at = now
+
+    def invalidate(self):
+        """Force every track to be re-matched (e.g. after the gallery changed)."""
+        for track in self.tracks:
+            track.match = None
@@ -1,14 +1,21 @@
+import csv
+import io
 import os
-import cv2
-import face_recognition
-import numpy as np
-import pickle
-from flask import Flask, request, redirect, url_for, render_template, flash
+import shutil
+import threading
+import zipfile
+from flask import Flask, request, redirect, url_for, render_template, flash, jsonify, Response
 from werkzeug.utils import secure_filename
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import and_, distinct, func, or_
 from sqlalchemy.orm import relationship
-from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from encoding_cache import EncodingCache, file_digest
+from encoding_pool import ENCODING_SETTINGS, ENCODING_WORKERS, NO_FACE, NO_LANDMARKS, EncodingPool
+from model_jobs import RebuildQueue
+from encoding_store import STORE_DIR, write_store
+from metrics import REGISTRY, read_metrics_files
+from recognition_service import create_service, prepare_image
 
 app = Flask(__name__)
 
@@ -22,6 +29,39 @@ db = SQLAlchemy(app)
 # Allowed file extensions for uploads
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
 
+# Bulk enrollment
+BULK_BATCH_SIZE = 100  # CSV rows inserted per database transaction
+BULK_MAX_IMAGE_BYTES = 20 * 1024 * 1024  # Largest uncompressed image accepted from an archive
+BULK_CSV_NAME = 'students.csv'  # CSV looked up inside the archive when none is uploaded separately
+STUDENT_FIELDS = ['name', 'emp', 'age', 'department', 'gmail', 'star']
+IMAGE_FIELDS = ['front_image', 'left_image', 'back_image']
+
+# Recognition API
+RECOGNIZE_MAX_IMAGES = 32  # Images accepted per /recognize request
+RECOGNIZE_TIMEOUT = 30  # Seconds a request waits for its results
+
+# Attendance listing
+ATTENDANCE_PAGE_SIZE = 50  # Rows per page by default
+ATTENDANCE_MAX_PAGE_SIZE = 500  # Upper bound for the `limit` query parameter
+ATTENDANCE_SUMMARY_DAYS = 31  # Days shown in the per-day summary
+
+# Encoding store output and the per-image cache used to skip unchanged images on rebuild
+ENCODE_STORE = STORE_DIR
+ENCODING_CACHE_FILE = 'EncodeCache.p'
+
+# Shared process pool for enrollment encoding; size it with ENCODING_WORKERS
+encoding_pool = EncodingPool(ENCODING_WORKERS, ENCODING_SETTINGS)
+
+# Rebuild metrics, served from /metrics together with the recognizer's metric files
+REBUILD_SECONDS = REGISTRY.histogram('model_rebuild_seconds', "Duration of update_model() rebuilds",
+                                     buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0))
+REBUILDS = REGISTRY.counter('model_rebuilds', "Finished model rebuilds by result", ('result',))
+REBUILD_ENCODINGS = REGISTRY.counter('model_rebuild_encodings', "Gallery images seen by rebuilds, by cache outcome",
+                                     ('outcome',))
+ENROLL_DETECT_SECONDS = REGISTRY.histogram('enrollment_detect_seconds',
+                                           "Face detection time per enrollment image, by the cascade step that found "
+                                           "the face ('none' if no detector did)", ('detector',))
+
 # Ensure the upload folder exists
 if not os.path.exists(app.config['UPLOAD_FOLDER']):
     os.makedirs(app.config['UPLOAD_FOLDER'])
@@ -50,9 +90,19 @@ class Attendance(db.Model):
     endtime = db.Column(db.DateTime)
     student = db.relationship('Student', backref=db.backref('attendances', lazy=True))
 
+    __table_args__ = (
+        # Newest-first listing and date filters
+        db.Index('ix_attendance_starttime', 'starttime'),
+        # Open-session lookups: student_id = ? AND endtime IS NULL
+        db.Index('ix_attendance_student_endtime', 'student_id', 'endtime'),
+    )
+
 # Create the database tables
 with app.app_context():
     db.create_all()
+    # create_all() skips existing tables, so add indexes missing from older databases
+    for index in Attendance.__table__.indexes:
+        index.create(db.engine, checkfirst=True)
 
 # Check if file extension is allowed
 def allowed_file(filename):
@@ -134,92 +184,416 @@ def upload_image():
         flash(f'Error saving images to database: {e}')
         return redirect(request.url)
     
-    # After uploading, update the model
-    update_model()
-    flash('Files successfully uploaded and model updated')
+    # After uploading, queue a model rebuild instead of blocking the request
+    job_id = rebuild_queue.request(reason=f"upload student {new_student.id}")
+    flash(f'Files successfully uploaded, model rebuild queued (job {job_id})')
     return redirect(url_for('upload_form'))
 
+def validate_bulk_row(row, archive):
+    """Check one CSV row; returns (student fields, {image field: archive member}) or raises ValueError."""
+    fields = {}
+    for field in STUDENT_FIELDS:
+        value = (row.get(field) or '').strip()
+        if not value:
+            raise ValueError(f"missing field: {field}")
+        fields[field] = value
+    try:
+        fields['age'] = int(fields['age'])
+        fields['star'] = int(fields['star'])
+    except ValueError:
+        raise ValueError("age and star must be numbers")
+    if fields['age'] <= 0:
+        raise ValueError("age must be a positive number")
+
+    members = {}
+    for img_field in IMAGE_FIELDS:
+        member_name = (row.get(img_field) or '').strip()
+        if not member_name:
+            raise ValueError(f"missing image: {img_field}")
+        if not allowed_file(member_name):
+            raise ValueError(f"invalid file type for {img_field}: {member_name}")
+        try:
+            member = archive.getinfo(member_name)
+        except KeyError:
+            raise ValueError(f"{member_name} not found in archive")
+        if member.file_size > BULK_MAX_IMAGE_BYTES:
+            raise ValueError(f"{member_name} is larger than {BULK_MAX_IMAGE_BYTES} bytes")
+        members[img_field] = member
+    return fields, members
+
+def extract_student_images(archive, student, members):
+    """Stream the row's images from the archive into UPLOAD_FOLDER; returns the saved paths."""
+    saved = []
+    try:
+        for img_field, member in members.items():
+            filename = secure_filename(os.path.basename(member.filename))
+            # Same naming scheme as /upload
+            filename = f"{student.id}_{img_field}_{filename}"
+            save_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+            with archive.open(member) as src, open(save_path, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            saved.append(save_path)
+            db.session.add(Image(image_filename=filename, image_type=img_field.replace('_image', ''),
+                                 student_id=student.id))
+    except Exception:
+        remove_files(saved)
+        raise
+    return saved
+
+def remove_files(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def import_batch(archive, batch, report):
+    """Insert one batch of (row number, CSV row) in a single transaction."""
+    done = []  # [(row number, student, saved paths)] pending the commit
+    for row_number, row in batch:
+        try:
+            fields, members = validate_bulk_row(row, archive)
+        except ValueError as e:
+            report.append({'row': row_number, 'status': 'error', 'error': str(e)})
+            continue
+        student = Student(**fields)
+        db.session.add(student)
+        try:
+            db.session.flush()  # Assigns student.id for the image filenames
+            saved = extract_student_images(archive, student, members)
+        except Exception as e:
+            # Only this row's pending objects are dropped; the rest of the batch stays
+            for obj in [obj for obj in db.session.new if isinstance(obj, Image) and obj.student_id == student.id]:
+                db.session.expunge(obj)
+            db.session.delete(student)
+            report.append({'row': row_number, 'status': 'error', 'error': f"{type(e).__name__}: {e}"})
+            continue
+        done.append((row_number, student, saved))
+
+    try:
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        for row_number, _, saved in done:
+            remove_files(saved)
+            report.append({'row': row_number, 'status': 'error', 'error': f"database error: {e}"})
+        return 0
+    for row_number, student, _ in done:
+        report.append({'row': row_number, 'status': 'ok', 'student_id': student.id})
+    return len(done)
+
+@app.route('/upload/bulk', methods=['POST'])
+def upload_bulk():
+    """Enroll many students from a zip archive of images and a CSV of student fields.
+
+    The CSV (uploaded as `students`, or `students.csv` inside the archive) has
+    the columns name, emp, age, department, gmail, star, front_image,
+    left_image and back_image; the image columns are paths inside the archive.
+    Images are streamed from the archive one at a time, rows are committed in
+    batches of BULK_BATCH_SIZE, and one model rebuild is queued at the end.
+    Returns a per-row JSON report.
+    """
+    upload = request.files.get('archive')
+    if upload is None or upload.filename == '':
+        return jsonify({'error': 'missing archive'}), 400
+    try:
+        # Werkzeug spools large uploads to a temporary file, so this reads from disk
+        archive = zipfile.ZipFile(upload.stream)
+    except zipfile.BadZipFile:
+        return jsonify({'error': 'archive is not a valid zip file'}), 400
+
+    with archive:
+        csv_upload = request.files.get('students')
+        if csv_upload is not None and csv_upload.filename != '':
+            csv_stream = io.TextIOWrapper(csv_upload.stream, encoding='utf-8-sig', newline='')
+        elif BULK_CSV_NAME in archive.namelist():
+            csv_stream = io.TextIOWrapper(archive.open(BULK_CSV_NAME), encoding='utf-8-sig', newline='')
+        else:
+            return jsonify({'error': f'missing students CSV (upload it or add {BULK_CSV_NAME} to the archive)'}), 400
+
+        report = []
+        enrolled = 0
+        batch = []
+        try:
+            # Row numbers count the header as row 1, like a spreadsheet
+            for row_number, row in enumerate(csv.DictReader(csv_stream), start=2):
+                batch.append((row_number, row))
+                if len(batch) >= BULK_BATCH_SIZE:
+                    enrolled += import_batch(archive, batch, report)
+                    batch = []
+        except (csv.Error, UnicodeDecodeError) as e:
+            report.append({'row': None, 'status': 'error', 'error': f"unreadable CSV: {e}"})
+        if batch:
+            enrolled += import_batch(archive, batch, report)
+
+    # One rebuild for the whole batch; the encoding cache skips already-known images
+    job_id = rebuild_queue.request(reason=f"bulk upload of {enrolled} students") if enrolled else None
+    report.sort(key=lambda entry: entry['row'] or 0)
+    return jsonify({
+        'enrolled': enrolled,
+        'failed': sum(1 for entry in report if entry['status'] == 'error'),
+        'job_id': job_id,
+        'rows': report,
+    })
+
+def run_update_model():
+    """Run update_model from the background rebuild thread."""
+    with app.app_context():
+        try:
+            with REBUILD_SECONDS.time():
+                stats = update_model()
+        except Exception:
+            REBUILDS.labels('failed').inc()
+            raise
+    REBUILDS.labels('completed').inc()
+    for outcome in ('reused', 'recomputed', 'dropped'):
+        REBUILD_ENCODINGS.labels(outcome).inc(stats[outcome])
+    return stats
+
+# Background rebuild queue; concurrent enrollments are merged into one rebuild
+rebuild_queue = RebuildQueue(run_update_model)
+REGISTRY.gauge('model_rebuild_queued', "Rebuild jobs waiting to run",
+               func=lambda: len(rebuild_queue.status()['queued']))
+
+@app.route('/model/rebuild', methods=['POST'])
+def model_rebuild():
+    job_id = rebuild_queue.request(reason='manual')
+    return jsonify({'job_id': job_id}), 202
+
+@app.route('/model/status')
+def model_status():
+    return jsonify(rebuild_queue.status())
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus text format: this app's metrics plus those exported by the recognizer."""
+    body = REGISTRY.render() + read_metrics_files()
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
 def update_model():
+    """Rebuild the encoding store, only encoding images that are not already in the cache."""
     folderPath = app.config['UPLOAD_FOLDER']
+    cache = EncodingCache(ENCODING_CACHE_FILE, ENCODING_SETTINGS)
     students = Student.query.all()
-    imgList = []
-    studentIds = []
+    gallery = []  # [(image digest, student id)] in enrollment order
+    pending = {}  # {image digest: (image path, student)} for cache misses
+    live_digests = set()
 
     for student in students:
         images = Image.query.filter_by(student_id=student.id).all()
         for image in images:
             img_path = os.path.join(folderPath, image.image_filename)
-            if os.path.exists(img_path):
-                img = cv2.imread(img_path)
-                if img is not None:
-                    imgList.append(img)
-                    studentIds.append(student.id)
-                else:
-                    print(f"Failed to load image for {student.name} (ID: {student.id})")
-            else:
+            if not os.path.exists(img_path):
                 print(f"Image file does not exist: {img_path}")
+                continue
+            digest = file_digest(img_path)
+            live_digests.add(digest)
+            gallery.append((digest, student.id))
+            hit, _ = cache.lookup(digest)
+            if not hit and digest not in pending:
+                pending[digest] = (img_path, student)
+
+    # Encode only the new or changed images, in parallel across the pool
+    digests = list(pending)
+    results = encoding_pool.encode_paths([pending[digest][0] for digest in digests])
+    detectors = {}  # {cascade step or 'none': {'images': count, 'seconds': total detection time}}
+    for digest, result in zip(digests, results):
+        if result.error in (None, NO_FACE, NO_LANDMARKS):
+            # A missing face is a property of the image, so it is cached too
+            cache.store(digest, result.encoding)
+        if result.error is not None:
+            student = pending[digest][1]
+            print(f"Failed to encode image for {student.name} (ID: {student.id}): {result.error}")
+        if result.detect_seconds is not None:
+            # Per-image record for tuning the cascade; job stats only keep the totals
+            detector = result.detector or 'none'
+            print(f"Face detection for {os.path.basename(pending[digest][0])}: {detector} "
+                  f"in {result.detect_seconds:.3f}s")
+            ENROLL_DETECT_SECONDS.labels(detector).observe(result.detect_seconds)
+            totals = detectors.setdefault(detector, {'images': 0, 'seconds': 0.0})
+            totals['images'] += 1
+            totals['seconds'] += result.detect_seconds
+
+    cache.prune(live_digests)
+    cache.save()
+    stats = cache.stats()
+    print(f"Encoding cache: {stats['reused']} reused, {stats['recomputed']} recomputed, "
+          f"{stats['dropped']} dropped")
+    for totals in detectors.values():
+        totals['seconds'] = round(totals['seconds'], 3)
+    if detectors:
+        print("Face detectors used: " + ", ".join(f"{detector} {totals['images']} ({totals['seconds']}s)"
+                                                  for detector, totals in sorted(detectors.items())))
+    stats['detectors'] = detectors
+
+    # Keep encodings and IDs aligned: images without a face contribute no row
+    encodeListKnown = []
+    studentIds = []
+    for digest, student_id in gallery:
+        encoding = cache.entries.get(digest)
+        if encoding is not None:
+            encodeListKnown.append(encoding)
+            studentIds.append(student_id)
 
-    if not imgList:
-        return
-
-    # Encode the images
-    encodeListKnown = findEncodings(imgList)
-    encodeListKnownWithIds = [encodeListKnown, studentIds]
+    stats['version'] = None
+    if not encodeListKnown:
+        return stats
 
-    # Save the encodings
+    # Write a new store version (with its IVF index); readers switch over atomically
     try:
-        with open("EncodeFile.p", 'wb') as file:
-            pickle.dump(encodeListKnownWithIds, file)
+        meta = write_store(encodeListKnown, studentIds, ENCODE_STORE)
+        stats['version'] = meta['version']
     except Exception as e:
-        print(f"Error saving encoding file: {e}")
-
-
-def findEncodings(imagesList):
-    encodeList = []
-
-    for img in imagesList:
-        # Resize image to reduce processing time and memory usage
-        small_img = cv2.resize(img, (0, 0), fx=0.25, fy=0.25)
-
-        # Convert to grayscale for contrast adjustment
-        gray_img = cv2.cvtColor(small_img, cv2.COLOR_BGR2GRAY)
-
-        # Apply CLAHE (Contrast Limited Adaptive Histogram Equalization) to improve local contrast
-        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-        equalized_img = clahe.apply(gray_img)
-
-        # Apply denoising to remove noise and artifacts that could affect recognition
-        denoised_img = cv2.fastNlMeansDenoising(equalized_img, None, 30, 7, 21)
-
-        # Convert back to RGB after contrast improvement and denoising
-        img_rgb = cv2.cvtColor(denoised_img, cv2.COLOR_GRAY2RGB)
-
-        # Normalize the image to a standard range [0, 1]
-        img_rgb = img_rgb / 255.0
-
-        # Detect face locations with a 'cnn' model for higher accuracy (requires GPU)
-        face_locations = face_recognition.face_locations(img_rgb, model='cnn')
-
-        # If a face is found, detect facial landmarks as a secondary verification
-        if face_locations:
-            # Extract facial landmarks to confirm accurate detection
-            face_landmarks = face_recognition.face_landmarks(img_rgb, face_locations)
-            if face_landmarks:
-                # Encode the face using the detected face locations
-                encodings = face_recognition.face_encodings(img_rgb, known_face_locations=face_locations)
-
-                if encodings:
-                    # Store the first encoding, assuming one face per image
-                    encodeList.append(encodings[0])
+        print(f"Error saving encoding store: {e}")
+        raise  # Mark the rebuild job as failed rather than completed without a version
+    return stats
+
+
+# Started on the first /recognize request so enrollment-only deployments don't load the gallery
+recognition_service = None
+recognition_service_lock = threading.Lock()
+
+def get_recognition_service():
+    global recognition_service
+    with recognition_service_lock:
+        if recognition_service is None:
+            recognition_service = create_service(ENCODE_STORE)
+        return recognition_service
+
+@app.route('/recognize', methods=['POST'])
+def recognize():
+    """Identify the faces in one or more images.
+
+    Send images as multipart files named `image` (repeat the field for several
+    images) or a single image as the raw request body with an image/* content
+    type. Images from concurrent requests are recognised together in
+    micro-batches. Returns, per image, the faces found with their box,
+    student_id (None if unknown) and distance.
+    """
+    uploads = [(file.filename, file.read()) for file in request.files.getlist('image')]
+    if not uploads and request.mimetype.startswith('image/'):
+        uploads = [(None, request.get_data())]
+    if not uploads:
+        return jsonify({'error': 'no image: send multipart files named "image" or an image/* body'}), 400
+    if len(uploads) > RECOGNIZE_MAX_IMAGES:
+        return jsonify({'error': f'at most {RECOGNIZE_MAX_IMAGES} images per request'}), 400
+
+    service = get_recognition_service()
+    if service.reloader.matcher is None:
+        return jsonify({'error': 'no encodings available yet; enroll students and rebuild the model'}), 503
+
+    # Decode in this request thread and queue every image before waiting on any
+    pending = []
+    for name, data in uploads:
+        prepared = prepare_image(data)
+        pending.append((name, service.submit(*prepared) if prepared is not None else None))
+
+    results = []
+    for name, future in pending:
+        if future is None:
+            results.append({'image': name, 'error': 'could not decode image'})
+            continue
+        try:
+            results.append({'image': name, 'faces': future.result(timeout=RECOGNIZE_TIMEOUT)})
+        except Exception as e:
+            results.append({'image': name, 'error': f"{type(e).__name__}: {e}"})
+    return jsonify({'results': results})
+
+def parse_date(value):
+    """Parse a YYYY-MM-DD query parameter, or return None if it is missing or invalid."""
+    try:
+        return datetime.strptime(value, '%Y-%m-%d') if value else None
+    except ValueError:
+        return None
 
-    return encodeList
+def encode_cursor(attendance):
+    return f"{attendance.starttime.isoformat()}_{attendance.id}"
 
+def decode_cursor(cursor):
+    """Return (starttime, id) from a cursor made by encode_cursor, or None."""
+    try:
+        starttime, attendance_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(starttime), int(attendance_id)
+    except (AttributeError, ValueError):
+        return None
+
+def attendance_filters(date_from, date_to, student_id):
+    """Filter clauses shared by the listing and the summary; all of them can use an index."""
+    filters = []
+    if date_from:
+        filters.append(Attendance.starttime >= date_from)
+    if date_to:
+        filters.append(Attendance.starttime < date_to + timedelta(days=1))
+    if student_id is not None:
+        filters.append(Attendance.student_id == student_id)
+    return filters
+
+def attendance_summary(filters, date_from=None, days=ATTENDANCE_SUMMARY_DAYS):
+    """Per-day sessions, distinct students and logged hours, aggregated in SQL."""
+    if date_from is None:
+        # Bound the scan to the days shown so the starttime index is used, not the whole table
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        filters = filters + [Attendance.starttime >= today - timedelta(days=days - 1)]
+    day = func.date(Attendance.starttime)
+    # SQLite stores datetimes as text; julianday() turns them into fractional days
+    hours = func.sum((func.julianday(Attendance.endtime) - func.julianday(Attendance.starttime)) * 24)
+    rows = (db.session.query(day.label('day'),
+                             func.count(Attendance.id).label('sessions'),
+                             func.count(distinct(Attendance.student_id)).label('students'),
+                             func.count(Attendance.endtime).label('closed'),
+                             hours.label('hours'))
+            .filter(*filters)
+            .group_by(day)
+            .order_by(day.desc())
+            .limit(days)
+            .all())
+    return [{'day': row.day, 'sessions': row.sessions, 'students': row.students,
+             'open': row.sessions - row.closed, 'hours': round(row.hours or 0.0, 2)} for row in rows]
 
 @app.route('/attendance')
 def attendance():
-    # Fetch all attendance records
-    records = db.session.query(Attendance, Student).join(Student).order_by(Attendance.starttime.desc()).all()
-    return render_template('attendance.html', records=records)
+    """One page of attendance records, newest first.
+
+    The first page also carries a per-day summary, covering the last
+    ATTENDANCE_SUMMARY_DAYS days unless `from` is given.
+
+    Query parameters: `from` and `to` (YYYY-MM-DD), `student_id`, `limit`, and
+    `after`, the `next_cursor` of the previous page. Pages are keyed on
+    (starttime, id) so each one is an index range scan, however deep it is.
+    Add `format=json` for a JSON response.
+    """
+    date_from = parse_date(request.args.get('from'))
+    date_to = parse_date(request.args.get('to'))
+    student_id = request.args.get('student_id', type=int)
+    limit = min(max(request.args.get('limit', ATTENDANCE_PAGE_SIZE, type=int), 1), ATTENDANCE_MAX_PAGE_SIZE)
+    cursor = decode_cursor(request.args.get('after'))
+    filters = attendance_filters(date_from, date_to, student_id)
+
+    query = db.session.query(Attendance, Student).join(Student).filter(*filters)
+    if cursor:
+        starttime, attendance_id = cursor
+        query = query.filter(or_(Attendance.starttime < starttime,
+                                 and_(Attendance.starttime == starttime, Attendance.id < attendance_id)))
+    # Fetch one extra row to know whether there is a next page
+    records = query.order_by(Attendance.starttime.desc(), Attendance.id.desc()).limit(limit + 1).all()
+    next_cursor = encode_cursor(records[limit - 1][0]) if len(records) > limit else None
+    records = records[:limit]
+    # The summary belongs to the first page; cursor pages only fetch their rows
+    summary = attendance_summary(filters, date_from) if cursor is None else None
+
+    if request.args.get('format') == 'json':
+        return jsonify({
+            'records': [{'id': record.id, 'student_id': student.id, 'name': student.name,
+                         'starttime': record.starttime.isoformat() if record.starttime else None,
+                         'endtime': record.endtime.isoformat() if record.endtime else None}
+                        for record, student in records],
+            'next_cursor': next_cursor,
+            'summary': summary,
+        })
+    filters_args = {'from': request.args.get('from'), 'to': request.args.get('to'),
+                    'student_id': student_id, 'limit': limit}
+    return render_template('attendance.html', records=records, summary=summary,
+                           next_cursor=next_cursor, filters=filters_args)
 
 # Mark attendance function
 @app.route('/mark_attendance', methods=['POST'])
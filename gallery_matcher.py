@@ -0,0 +1,107 @@
+import numpy as np
+
+ENCODING_DIM = 128
+
+
+class GalleryMatcher:
+    """Batched nearest-student lookup over the known face encodings.
+
+    The gallery is stored once as a contiguous float32 matrix with duplicate
+    (student, encoding) rows removed and rows grouped by student, together
+    with the precomputed squared norm of every row. All faces of a frame are
+    matched with a single matrix product, and distances are reduced to the
+    closest encoding of each student.
+    """
+
+    def __init__(self, encodings, student_ids):
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_DIM)
+        student_ids = np.asarray(student_ids, dtype=np.int64).reshape(-1)
+        if len(encodings) != len(student_ids):
+            raise ValueError(f"{len(encodings)} encodings but {len(student_ids)} student IDs")
+
+        # Drop exact duplicate rows for the same student
+        seen = set()
+        keep = []
+        for index, (encoding, student_id) in enumerate(zip(encodings, student_ids)):
+            key = (int(student_id), encoding.tobytes())
+            if key not in seen:
+                seen.add(key)
+                keep.append(index)
+        encodings = encodings[keep]
+        student_ids = student_ids[keep]
+
+        # Group rows by student so per-student minima are a single reduceat
+        order = np.argsort(student_ids, kind='stable')
+        self._set_rows(np.ascontiguousarray(encodings[order]), student_ids[order])
+
+    @classmethod
+    def from_grouped(cls, embeddings, row_ids, sq_norms=None):
+        """Wrap rows that are already deduplicated and grouped by student, without copying.
+
+        Used for the memory-mapped arrays of the encoding store.
+        """
+        matcher = cls.__new__(cls)
+        matcher._set_rows(embeddings, row_ids, sq_norms)
+        return matcher
+
+    def _set_rows(self, embeddings, row_ids, sq_norms=None):
+        self.embeddings = embeddings
+        self.row_ids = row_ids
+        self.student_ids, self.group_starts = np.unique(self.row_ids, return_index=True)
+        if sq_norms is None:
+            sq_norms = np.einsum('ij,ij->i', self.embeddings, self.embeddings)
+        self.sq_norms = sq_norms
+
+    def __len__(self):
+        return len(self.embeddings)
+
+    @property
+    def num_students(self):
+        return len(self.student_ids)
+
+    def distances(self, face_encodings):
+        """Return the (faces x gallery rows) Euclidean distance matrix."""
+        queries = np.asarray(face_encodings, dtype=np.float32).reshape(-1, ENCODING_DIM)
+        q_norms = np.einsum('ij,ij->i', queries, queries)
+        sq_dist = q_norms[:, None] + self.sq_norms[None, :] - 2.0 * (queries @ self.embeddings.T)
+        np.maximum(sq_dist, 0.0, out=sq_dist)
+        return np.sqrt(sq_dist, out=sq_dist)
+
+    def student_distances(self, face_encodings):
+        """Return the (faces x students) distance to each student's closest encoding."""
+        return np.minimum.reduceat(self.distances(face_encodings), self.group_starts, axis=1)
+
+    def match(self, face_encodings, k=1):
+        """Return, for every face, the k closest students as [(student_id, distance)]."""
+        face_encodings = list(face_encodings)
+        if not face_encodings or not len(self.embeddings):
+            return [[] for _ in face_encodings]
+
+        dist = self.student_distances(face_encodings)
+        k = min(k, dist.shape[1])
+        if k < dist.shape[1]:
+            top = np.argpartition(dist, k - 1, axis=1)[:, :k]
+        else:
+            top = np.tile(np.arange(dist.shape[1]), (dist.shape[0], 1))
+        top_dist = np.take_along_axis(dist, top, axis=1)
+        order = np.argsort(top_dist, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_dist = np.take_along_axis(top_dist, order, axis=1)
+
+        return [[(int(self.student_ids[col]), float(d)) for col, d in zip(cols, dists)]
+                for cols, dists in zip(top, top_dist)]
+
+    def best(self, face_encodings, threshold):
+        """Return (student_id, distance) per face; student_id is None above the threshold."""
+        return best_matches(self.match(face_encodings, k=1), threshold)
+
+
+def best_matches(match_results, threshold):
+    """Reduce top-k match results to the closest student if it is under the threshold."""
+    results = []
+    for candidates in match_results:
+        if candidates and candidates[0][1] < threshold:
+            results.append(candidates[0])
+        else:
+            results.append((None, candidates[0][1] if candidates else float('inf')))
+    return results
@@ -3,16 +3,50 @@ import face_recognition
 import numpy as np
 import pickle
 import os
+import argparse
 import sqlite3
+import threading
+import time
+from collections import namedtuple
 from datetime import datetime, timedelta
+from gallery_matcher import GalleryMatcher
+from ann_index import DEFAULT_NPROBE, IVFIndex, index_path_for
+import encoding_store
+from encoding_reloader import MatcherReloader
+from student_cache import StudentCache
+from attendance_writer import AttendanceWriter
+from pipeline import DropOldestQueue, Stage, StageStats
+from face_tracker import REENCODE_INTERVAL, FaceTracker
+from motion_gate import MOTION_KEEPALIVE, MOTION_SENSITIVITY, MotionGate
+from render_cache import RenderCache
+from metrics import METRICS_DIR, MetricsFileExporter, Registry
 
 # Constants
 LED_TIMEOUT = 5  # Duration in seconds to keep the LED on (Unused in this context)
 DISPLAY_EXTRA_TIME = 30  # Additional seconds to keep the display after person leaves
 ENCODING_DISTANCE_THRESHOLD = 0.45  # Reduced for stronger accuracy
 SCALE_FACTOR = 0.25  # Keeps the image at a reasonable scale for real-time processing
+LOGOUT_AFTER = 30  # Seconds without a sighting before a student's attendance is logged out
+FRAME_QUEUE_SIZE = 1  # Camera frames buffered for recognition; only the newest is kept
+RENDER_INTERVAL_MS = 33  # Display refresh period (~30 FPS), independent of recognition speed
+STATS_REPORT_INTERVAL = 30  # Seconds between pipeline throughput reports
 # Database setup
 DATABASE = 'students.db'
+METRICS_FILE = os.path.join(METRICS_DIR, 'recognizer.prom')  # Read by the Flask app's /metrics
+
+# The recognizer's own registry, exported to METRICS_FILE, so importing this module
+# (e.g. from the Flask app) doesn't add recognizer metrics to that process's /metrics
+RECOGNIZER_METRICS = Registry()
+
+# Per-frame latency of each stage; gauges are registered by main()
+STAGE_SECONDS = RECOGNIZER_METRICS.histogram('recognizer_stage_seconds',
+                                             "Time spent per frame in each recognizer stage", ('stage',))
+CAPTURE_SECONDS = STAGE_SECONDS.labels('capture')
+DETECT_SECONDS = STAGE_SECONDS.labels('detect')
+ENCODE_SECONDS = STAGE_SECONDS.labels('encode')
+MATCH_SECONDS = STAGE_SECONDS.labels('match')
+DB_SECONDS = STAGE_SECONDS.labels('db')
+RENDER_SECONDS = STAGE_SECONDS.labels('render')
 
 def get_student_info(student_id):
     """Fetch student information from the database using student ID."""
@@ -39,35 +73,22 @@ def get_student_info(student_id):
         return None
 
 
-# Track attendance IDs to update endtime
-attendance_ids = {}  # {student_id: attendance_id}
+# Background writer that owns the attendance database connection; started by main()
+attendance_writer = None
 
 def log_attendance_in(student_id):
-    """Log the attendance of a student (insert starttime and leave endtime empty)."""
-    try:
-        conn = sqlite3.connect(DATABASE)
-        cursor = conn.cursor()
-        cursor.execute("INSERT INTO attendance (student_id, starttime) VALUES (?, ?)", (student_id, datetime.now()))
-        conn.commit()
-        attendance_id = cursor.lastrowid  # Get the ID of the newly created row for future updates
-        conn.close()
-        print(f"Attendance logged in for student ID {student_id} at {datetime.now()} with attendance ID {attendance_id}")
-        return attendance_id
-    except sqlite3.Error as e:
-        print(f"Failed to log attendance in: {e}")
-        return None
+    """Queue the attendance login of a student (insert starttime and leave endtime empty).
+
+    Returns a Future that resolves to the new attendance ID, or None if the write failed.
+    """
+    return attendance_writer.log_in(student_id)
 
 def log_attendance_out(attendance_id):
-    """Update the attendance record of a student (add endtime)."""
-    try:
-        conn = sqlite3.connect(DATABASE)
-        cursor = conn.cursor()
-        cursor.execute("UPDATE attendance SET endtime = ? WHERE id = ?", (datetime.now(), attendance_id))
-        conn.commit()
-        conn.close()
-        print(f"Attendance logged out for attendance ID {attendance_id} at {datetime.now()}")
-    except sqlite3.Error as e:
-        print(f"Failed to log attendance out: {e}")
+    """Queue the attendance logout of a student (add endtime).
+
+    Accepts an attendance ID or the Future returned by log_attendance_in.
+    """
+    return attendance_writer.log_out(attendance_id)
 
 def load_encodings(encode_file_path):
     if not os.path.exists(encode_file_path):
@@ -85,6 +106,53 @@ def load_encodings(encode_file_path):
     print(f"Loaded {len(encodeListKnown)} encodings for {len(set(studentIds))} students.")
     return encodeListKnown, studentIds
 
+def load_matcher(store_dir, index='exact', nprobe=DEFAULT_NPROBE, legacy_file='EncodeFile.p', required=True):
+    """Open the encoding store as an exact matcher, or its IVF index if requested.
+
+    Without any encodings this exits, or returns None if `required` is False.
+    """
+    stored = encoding_store.open_store(store_dir)
+    if stored is None:
+        if not os.path.exists(legacy_file):
+            print(f"Encoding store {store_dir} not found.")
+            if not required:
+                return None
+            exit(1)
+        # Old pickle format; convert it with `python encoding_store.py` for fast startup
+        print(f"Encoding store {store_dir} not found, falling back to {legacy_file}.")
+        encodeListKnown, studentIds = load_encodings(legacy_file)
+        if index == 'ivf':
+            return IVFIndex.build(encodeListKnown, studentIds, nprobe=nprobe)
+        return GalleryMatcher(encodeListKnown, studentIds)
+
+    meta = stored.meta
+    print(f"Loaded encoding store version {meta['version']}: "
+          f"{meta['count']} encodings for {meta['students']} students.")
+    if index == 'ivf':
+        index_path = index_path_for(stored.path)
+        if os.path.exists(index_path):
+            try:
+                ann = IVFIndex.load(index_path, nprobe=nprobe)
+            except Exception as e:
+                print(f"IVF index {index_path} is unreadable ({e}), rebuilding it.")
+            else:
+                if ann.version == meta['digest']:
+                    print(f"Using IVF index with {ann.nlist} lists, nprobe={nprobe}.")
+                    return ann
+                print(f"IVF index {index_path} is stale, rebuilding it.")
+        else:
+            print(f"IVF index {index_path} not found, building it.")
+        ann = IVFIndex.build(np.asarray(stored.embeddings), np.asarray(stored.student_ids),
+                             nprobe=nprobe, version=meta['digest'])
+        ann.save(index_path)
+        return ann
+    return encoding_store.load_matcher(stored)
+
+def init_worker_process():
+    """Initializer for recognition worker processes."""
+    # One OpenCV thread per worker process; the pool provides the parallelism
+    cv2.setNumThreads(1)
+
 def preprocess_image(image, scale_factor):
     """Apply preprocessing steps to the image."""
     # Resize for faster processing
@@ -92,20 +160,36 @@ def preprocess_image(image, scale_factor):
     img_rgb = cv2.cvtColor(img_resized, cv2.COLOR_BGR2RGB)
     return img_rgb
 
-def enhance_encoding(known_encodings, known_ids):
-    """Add multi-angle encoding for each person to improve recognition accuracy."""
-    multi_angle_encodings = []
-    multi_angle_ids = []
-
-    for encoding, student_id in zip(known_encodings, known_ids):
-        # Rotate the face by small angles to create multiple encodings for the same person
-        for angle in [-10, 0, 10]:  # Add variations
-            multi_angle_encodings.append(encoding)  # Add the same encoding for simplicity
-            multi_angle_ids.append(student_id)
+def load_student_photo(student_id, IMAGES_FOLDER):
+    """Load the student's front image resized for the display, or None."""
+    try:
+        conn = sqlite3.connect(DATABASE)
+        cursor = conn.cursor()
+        cursor.execute("SELECT image_filename FROM image WHERE student_id = ? AND image_type = 'front'", (student_id,))
+        front_images = cursor.fetchall()
+        conn.close()
+    except sqlite3.Error as e:
+        print(f"Database error while fetching images: {e}")
+        front_images = []
 
-    return multi_angle_encodings, multi_angle_ids
+    if not front_images:
+        print(f"No front image found for student ID {student_id}")
+        return None
 
-def display_student_info(imgDisplay, studentInfo, IMAGES_FOLDER, imgrecognize):
+    for front_image in front_images:
+        student_image_path = os.path.join(IMAGES_FOLDER, front_image[0])
+        if not os.path.exists(student_image_path):
+            print(f"Image file does not exist: {student_image_path}")
+            continue
+        student_img = cv2.imread(student_image_path)
+        if student_img is None:
+            print(f"Failed to load image for student ID {student_id}")
+            continue
+        # Resize the student image to fit on the display
+        return cv2.resize(student_img, (300, 300))
+    return None
+
+def display_student_info(imgDisplay, studentInfo, studentPhoto, imgrecognize):
     """Display student information and overlay their image on the display."""
     imgDisplay[0:657, 0:1313] = imgrecognize
     if not studentInfo:
@@ -130,50 +214,232 @@ def display_student_info(imgDisplay, studentInfo, IMAGES_FOLDER, imgrecognize):
     cv2.putText(imgDisplay, f"Dep: {studentInfo['department']}", (550, 430), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 2)
     cv2.putText(imgDisplay, f"Gmail: {studentInfo['gmail']}", (180, 550), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 2)
 
-    # Load and overlay one of the student's images (front image preferred)
-    try:
-        conn = sqlite3.connect(DATABASE)
-        cursor = conn.cursor()
-        cursor.execute("SELECT image_filename FROM image WHERE student_id = ? AND image_type = 'front'", (studentInfo['id'],))
-        front_images = cursor.fetchall()
-        conn.close()
-    except sqlite3.Error as e:
-        print(f"Database error while fetching images: {e}")
-        front_images = []
+    # Overlay the student's front image (loaded and resized once by the cache)
+    if studentPhoto is not None:
+        # Define the position where the image will be placed
+        x_offset, y_offset = 900, 180  # Adjust as needed
+        # Ensure that the overlay does not go out of bounds
+        if (y_offset + studentPhoto.shape[0] < imgDisplay.shape[0] and
+            x_offset + studentPhoto.shape[1] < imgDisplay.shape[1]):
+            imgDisplay[y_offset:y_offset + studentPhoto.shape[0],
+                       x_offset:x_offset + studentPhoto.shape[1]] = studentPhoto
+        else:
+            print(f"Overlay position out of bounds for student ID {studentInfo['id']}")
 
-    if front_images:
-        for front_image in front_images:
-            student_image_path = os.path.join(IMAGES_FOLDER, front_image[0])  # Corrected variable name
-            if os.path.exists(student_image_path):
-                student_img = cv2.imread(student_image_path)
-                if student_img is not None:
-                    # Resize the student image to fit on the display (e.g., 200x200)
-                    student_img = cv2.resize(student_img, (300, 300))
-                    # Define the position where the image will be placed
-                    x_offset, y_offset = 900, 180  # Adjust as needed
-                    # Ensure that the overlay does not go out of bounds
-                    if (y_offset + student_img.shape[0] < imgDisplay.shape[0] and
-                        x_offset + student_img.shape[1] < imgDisplay.shape[1]):
-                        imgDisplay[y_offset:y_offset + student_img.shape[0],
-                                   x_offset:x_offset + student_img.shape[1]] = student_img
-                    else:
-                        print(f"Overlay position out of bounds for student ID {studentInfo['id']}")
-                else:
-                    print(f"Failed to load image for student ID {studentInfo['id']}")
-            else:
-                print(f"Image file does not exist: {student_image_path}")
-    else:
-        print(f"No front image found for student ID {studentInfo['id']}")
+def detect_faces(imgS):
+    """Detect face locations and compute their encodings in a preprocessed frame."""
+    with DETECT_SECONDS.time():
+        faceCurFrame = face_recognition.face_locations(imgS, model='hog')  # Use 'cnn' for more accuracy
+    with ENCODE_SECONDS.time():
+        encodeCurFrame = face_recognition.face_encodings(imgS, faceCurFrame)
+    return faceCurFrame, encodeCurFrame
+
+def recognize_faces(imgS, matcher, face_tracker=None):
+    """Detect, encode and match every face in a preprocessed frame.
+
+    Returns the face locations and a (student_id, distance) match per face,
+    with student_id None for faces above the distance threshold. With a
+    face_tracker, faces followed from earlier frames reuse their last match
+    and only new or stale tracks are encoded.
+    """
+    if face_tracker is None:
+        faceCurFrame, encodeCurFrame = detect_faces(imgS)
+        # Match every face in the frame against the gallery in one batch
+        with MATCH_SECONDS.time():
+            matches = matcher.best(encodeCurFrame, ENCODING_DISTANCE_THRESHOLD)
+        return faceCurFrame, matches
+
+    with DETECT_SECONDS.time():
+        faceCurFrame = face_recognition.face_locations(imgS, model='hog')  # Use 'cnn' for more accuracy
+    now = time.monotonic()
+    tracks = face_tracker.update(faceCurFrame)
+    stale = face_tracker.to_encode(tracks, now)
+    if stale:
+        with ENCODE_SECONDS.time():
+            encodeCurFrame = face_recognition.face_encodings(imgS, [track.box for track in stale])
+        with MATCH_SECONDS.time():
+            stale_matches = matcher.best(encodeCurFrame, ENCODING_DISTANCE_THRESHOLD)
+        face_tracker.set_matches(stale, stale_matches, now)
+    return faceCurFrame, [track.match for track in tracks]
+
+
+class AttendanceTracker:
+    """Attendance login/logout and the student currently shown on the display.
+
+    Updated by the recognition stage and read by the render stage, so shared
+    state is only touched under a lock.
+    """
+
+    def __init__(self, student_cache, logout_after=LOGOUT_AFTER, display_time=DISPLAY_EXTRA_TIME):
+        self.student_cache = student_cache
+        self.logout_after = logout_after
+        self.display_time = display_time
+        self.attendance_ids = {}  # {student_id: Future resolving to the attendance_id}
+        self.last_seen = {}  # To track the last time each student was seen
+        self.logged_out_students = {}  # To track students who were logged out
+        self.last_displayed_student = None
+        self.display_info_until = None  # Timestamp until which to display the info
+        self._lock = threading.Lock()
+
+    def update(self, matches, current_time):
+        """Record the students recognised in one frame; returns True if a face was unknown."""
+        unknown_face = False
+        for student_id, distance in matches:
+            if student_id is None:
+                unknown_face = True
+                continue
+            studentInfo = self.student_cache.get_info(student_id)
+            with self._lock:
+                self.last_seen[student_id] = current_time
+
+                # Handle attendance logging; retry if the previous login failed to write
+                attendance_id = self.attendance_ids.get(student_id)
+                if attendance_id is None or (attendance_id.done() and attendance_id.result() is None):
+                    self.attendance_ids[student_id] = log_attendance_in(student_id)
+
+                self.logged_out_students.pop(student_id, None)
 
-def main():
-    # Load encoding file
-    ENCODE_FILE = 'EncodeFile.p'
-    encodeListKnown, studentIds = load_encodings(ENCODE_FILE)
-    encodeListKnown, studentIds = enhance_encoding(encodeListKnown, studentIds)
+                # Update display variables
+                self.last_displayed_student = studentInfo
+                self.display_info_until = current_time + timedelta(seconds=self.display_time)
+
+        self.expire(current_time)
+        return unknown_face
+
+    def expire(self, current_time):
+        """Log attendance out for students who haven't been detected for a while."""
+        with self._lock:
+            to_logout = []
+            for student_id, last_seen_time in self.last_seen.items():
+                if (current_time - last_seen_time).total_seconds() > self.logout_after:
+                    attendance_id = self.attendance_ids.pop(student_id, None)
+                    if attendance_id:
+                        log_attendance_out(attendance_id)
+                        self.logged_out_students[student_id] = current_time  # Track when they were logged out
+                        to_logout.append(student_id)
+
+            # Remove logged-out students from `last_seen`
+            for student_id in to_logout:
+                del self.last_seen[student_id]
+
+    def displayed_student(self, current_time):
+        """Return the student to show, or None once the display timeout has passed."""
+        with self._lock:
+            if self.last_displayed_student and current_time >= self.display_info_until:
+                self.last_displayed_student = None  # Clear the display after timeout
+            return self.last_displayed_student
+
+
+# One processed frame: face locations, (student_id, distance) matches and whether any face was unknown
+RecognitionResult = namedtuple('RecognitionResult', ['frame_id', 'captured_at', 'face_locations', 'matches', 'unknown_face'])
+
+
+class CaptureStage(Stage):
+    """Reads camera frames as fast as the camera delivers them."""
+
+    def __init__(self, cap, frames, stop_event, name='capture'):
+        super().__init__(name, stop_event)
+        self.cap = cap
+        self.frames = frames
+        self.frame_id = 0
+
+    def step(self):
+        with CAPTURE_SECONDS.time():
+            success, img = self.cap.read()
+        if not success:
+            print("Failed to grab frame")
+            return False
+        self.frame_id += 1
+        self.frames.put((self.frame_id, time.monotonic(), img))
+        self.stats.tick()
+
+
+class RecognitionStage(Stage):
+    """Runs detection, encoding, matching and attendance on the newest frame."""
+
+    def __init__(self, frames, results, reloader, student_cache, tracker, stop_event,
+                 face_tracker=None, motion_gate=None):
+        super().__init__('recognition', stop_event)
+        self.frames = frames
+        self.results = results
+        self.reloader = reloader
+        self.student_cache = student_cache
+        self.tracker = tracker
+        self.face_tracker = face_tracker
+        self.motion_gate = motion_gate
+        self.cached_version_dir = reloader.version_dir
+
+    def step(self):
+        # Newest frame only; anything older that piled up while recognizing is stale
+        frame = self.frames.get_latest(timeout=0.5)
+        if frame is None:
+            return
+        frame_id, captured_at, img = frame
+
+        # The reloader swaps in a new matcher between frames when enrollments change
+        version_dir, matcher = self.reloader.current
+        if version_dir != self.cached_version_dir:
+            # Enrollment data changed; re-read student rows and photos and re-match tracked faces
+            self.student_cache.clear()
+            if self.face_tracker is not None:
+                self.face_tracker.invalidate()
+            self.cached_version_dir = version_dir
+
+        # Preprocess the image (resize and convert to RGB)
+        imgS = preprocess_image(img, SCALE_FACTOR)
+        current_time = datetime.now()
+
+        # Skip detection on idle frames unless someone is currently being shown
+        person_present = self.tracker.displayed_student(current_time) is not None
+        if self.motion_gate is None or self.motion_gate.should_detect(imgS, time.monotonic(), person_present):
+            faceCurFrame, matches = recognize_faces(imgS, matcher, self.face_tracker)
+        else:
+            faceCurFrame, matches = [], []
+        with DB_SECONDS.time():
+            unknown_face = self.tracker.update(matches, current_time)
+        self.results.put(RecognitionResult(frame_id, captured_at, faceCurFrame, matches, unknown_face))
+        self.stats.tick()
+
+
+def register_metrics(capture, recognition, render_stats, frames, student_cache, face_tracker=None, motion_gate=None):
+    """Expose throughput, queue depths and cache effectiveness as gauges read at export time."""
+    fps = RECOGNIZER_METRICS.gauge('recognizer_fps', "Frames per second over the recent window", ('stage',))
+    for stats in (capture.stats, recognition.stats, render_stats):
+        fps.set_function(stats.fps, stats.name)
+    RECOGNIZER_METRICS.gauge('recognizer_frame_queue_depth', "Frames waiting for recognition", func=lambda: len(frames))
+    RECOGNIZER_METRICS.gauge('recognizer_frames_dropped', "Frames dropped because recognition fell behind",
+                   func=lambda: frames.dropped)
+    RECOGNIZER_METRICS.gauge('recognizer_attendance_queue_depth', "Attendance writes waiting to be committed",
+                   func=lambda: attendance_writer.pending())
+    RECOGNIZER_METRICS.gauge('recognizer_student_cache_hit_rate', "Student info/photo cache hit rate",
+                   func=lambda: student_cache.stats()['hit_rate'])
+    if face_tracker is not None:
+        tracked = RECOGNIZER_METRICS.gauge('recognizer_tracked_faces', "Faces encoded or reused by the face tracker",
+                                 ('result',))
+        tracked.set_function(lambda: face_tracker.encoded, 'encoded')
+        tracked.set_function(lambda: face_tracker.reused, 'reused')
+    if motion_gate is not None:
+        gated = RECOGNIZER_METRICS.gauge('recognizer_motion_gate_frames', "Frames passed to or skipped by the motion gate",
+                               ('result',))
+        gated.set_function(lambda: motion_gate.detected, 'detected')
+        gated.set_function(lambda: motion_gate.skipped, 'skipped')
+
+
+def main(index='exact', nprobe=DEFAULT_NPROBE, reencode_interval=REENCODE_INTERVAL,
+         motion_sensitivity=MOTION_SENSITIVITY, motion_keepalive=MOTION_KEEPALIVE):
+    global attendance_writer
+    attendance_writer = AttendanceWriter(DATABASE)
+
+    # Open the encoding store and pick up new versions published by the Flask app
+    reloader = MatcherReloader(lambda: load_matcher(encoding_store.STORE_DIR, index, nprobe))
 
     # Define the path to the Images folder
     IMAGES_FOLDER = os.path.join('static', 'Images')  # Ensure this path matches Flask's UPLOAD_FOLDER
 
+    # Student rows and resized photos, so steady-state frames do no disk or database I/O
+    student_cache = StudentCache(get_student_info, lambda student_id: load_student_photo(student_id, IMAGES_FOLDER))
+    tracker = AttendanceTracker(student_cache)
+
     # Initialize webcam
     cap = cv2.VideoCapture(0)
     cap.set(3, 640)  # Width
@@ -198,98 +464,94 @@ def main():
     imgrecognize = cv2.resize(imgrecognize, (1313, 657))
     imgunrecognize = cv2.resize(imgunrecognize, (1313, 657))
 
-    # Variables to manage display timing
-    last_displayed_student = None
-    display_info_until = None  # Timestamp until which to display the info
-
-    last_seen = {}  # To track the last time each student was seen
-    logged_out_students = {}  # To track students who were logged out
+    # Capture and recognition run on their own threads, joined by drop-oldest
+    # queues; this (main) thread only renders, since cv2.imshow must stay here
+    stop_event = threading.Event()
+    frames = DropOldestQueue(FRAME_QUEUE_SIZE)
+    results = DropOldestQueue(1)
+    capture = CaptureStage(cap, frames, stop_event)
+    # Faces followed across frames are only re-encoded when new, stale or after a jump;
+    # a non-positive interval disables tracking and encodes every face in every frame
+    face_tracker = FaceTracker(reencode_interval) if reencode_interval > 0 else None
+    # Idle frames skip HOG detection; a non-positive sensitivity detects on every frame
+    motion_gate = MotionGate(motion_sensitivity, keepalive=motion_keepalive) if motion_sensitivity > 0 else None
+    recognition = RecognitionStage(frames, results, reloader, student_cache, tracker, stop_event,
+                                   face_tracker=face_tracker, motion_gate=motion_gate)
+    render_stats = StageStats('render')
+    render_cache = RenderCache(imgBackground)
+    register_metrics(capture, recognition, render_stats, frames, student_cache, face_tracker, motion_gate)
+    exporter = MetricsFileExporter(METRICS_FILE, RECOGNIZER_METRICS)
+    capture.start()
+    recognition.start()
+    exporter.start()
+    next_report = time.monotonic() + STATS_REPORT_INTERVAL
 
     # Main loop
     print("Starting face recognition. Press 'q' to quit.")
 
-    while True:
-        success, img = cap.read()
-        if not success:
-            print("Failed to grab frame")
-            break
-
-        # Preprocess the image (resize and convert to RGB)
-        imgS = preprocess_image(img, SCALE_FACTOR)
-
-        # Detect face locations and encodings in the current frame
-        faceCurFrame = face_recognition.face_locations(imgS, model='hog')  # Use 'cnn' for more accuracy
-        encodeCurFrame = face_recognition.face_encodings(imgS, faceCurFrame)
-        imgDisplay = imgBackground.copy()
-        current_detected_ids = set()
+    while not stop_event.is_set():
+        render_start = time.perf_counter()
+        result = results.peek_latest()
         current_time = datetime.now()
 
-        recognized_face = False
-
-        for encodeFace, faceLoc in zip(encodeCurFrame, faceCurFrame):
-            # Use face distance to improve accuracy
-            faceDis = face_recognition.face_distance(encodeListKnown, encodeFace)
-            matchIndex = np.argmin(faceDis)
-
-            if faceDis[matchIndex] < ENCODING_DISTANCE_THRESHOLD:  # Adjusted threshold
-                recognized_face = True
-                student_id = studentIds[matchIndex]
-                current_detected_ids.add(student_id)
-
-                studentInfo = get_student_info(student_id)
-                last_seen[student_id] = current_time
-
-                # Handle attendance logging
-                if student_id not in attendance_ids:
-                    attendance_id = log_attendance_in(student_id)
-                    if attendance_id:
-                        attendance_ids[student_id] = attendance_id
-
-                if student_id in logged_out_students:
-                    del logged_out_students[student_id]
-
-                # Update display variables
-                last_displayed_student = studentInfo
-                display_info_until = current_time + timedelta(seconds=DISPLAY_EXTRA_TIME)
-            else:
-                imgDisplay[0:657, 0:1313] = imgunrecognize
-
-        # Log attendance out if a student hasn't been detected for a while
-        to_logout = []
-        for student_id, last_seen_time in last_seen.items():
-            if (current_time - last_seen_time).total_seconds() > 30:
-                # Log the student's attendance out
-                attendance_id = attendance_ids.get(student_id)
-                if attendance_id:
-                    log_attendance_out(attendance_id)
-                    del attendance_ids[student_id]
-                    logged_out_students[student_id] = current_time  # Track when they were logged out
-                    to_logout.append(student_id)
-
-        # Remove logged-out students from `last_seen`
-        for student_id in to_logout:
-            del last_seen[student_id]   
-
-        # Display the last detected student's info if within the display timeout
-        if last_displayed_student and current_time < display_info_until:
-            display_student_info(imgDisplay, last_displayed_student, IMAGES_FOLDER, imgrecognize)
-        elif last_displayed_student and current_time >= display_info_until:
-            last_displayed_student = None  # Clear the display after timeout
-
-        # Display logged-out students for a brief period after logout
-        for student_id, logout_time in logged_out_students.items():
-            if (current_time - logout_time).total_seconds() <= DISPLAY_EXTRA_TIME:
-                studentInfo = get_student_info(student_id)
-
-        # Display the updated background with attendance info
-        cv2.imshow("Face Attendance", imgDisplay)
-        key = cv2.waitKey(1)
+        # Display the last detected student's info if within the display timeout;
+        # each distinct screen is composed once and reused until the state changes
+        studentInfo = tracker.displayed_student(current_time)
+        if studentInfo:
+            studentPhoto = student_cache.get_photo(studentInfo['id'])
+            imgDisplay, changed = render_cache.get(
+                ('student', tuple(studentInfo.items()), id(studentPhoto)),
+                lambda img: display_student_info(img, studentInfo, studentPhoto, imgrecognize),
+                keep=studentPhoto)
+        elif result is not None and result.unknown_face:
+            imgDisplay, changed = render_cache.get(('unknown',),
+                                                   lambda img: np.copyto(img[0:657, 0:1313], imgunrecognize))
+        else:
+            imgDisplay, changed = render_cache.get(('idle',))
+
+        # Display the updated background with attendance info; the window keeps
+        # showing the last frame, so only push a new one when it changed
+        if changed:
+            cv2.imshow("Face Attendance", imgDisplay)
+        RENDER_SECONDS.observe(time.perf_counter() - render_start)
+        render_stats.tick()
+        key = cv2.waitKey(RENDER_INTERVAL_MS)
         if key == ord('q'):
             break
 
-    # Cleanup
+        if time.monotonic() >= next_report:
+            print(f"Pipeline: {capture.stats} ({frames.dropped} frames dropped) | "
+                  f"{recognition.stats} | {render_stats}")
+            if face_tracker is not None:
+                print(f"Face tracker: {face_tracker.encoded} faces encoded, {face_tracker.reused} reused")
+            if motion_gate is not None:
+                print(f"Motion gate: {motion_gate.skipped} of {motion_gate.detected + motion_gate.skipped} "
+                      f"frames skipped")
+            next_report = time.monotonic() + STATS_REPORT_INTERVAL
+
+    # Cleanup; flush any attendance writes still queued
+    stop_event.set()
+    capture.join()
+    recognition.join()
+    attendance_writer.close()
+    reloader.stop()
+    exporter.stop()
     cap.release()
     cv2.destroyAllWindows()
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Real-time face recognition kiosk")
+    parser.add_argument('--index', choices=['exact', 'ivf'], default='exact',
+                        help="gallery search: exact scan or approximate IVF index for large galleries")
+    parser.add_argument('--nprobe', type=int, default=DEFAULT_NPROBE,
+                        help="IVF lists scanned per face; higher improves recall at the cost of speed")
+    parser.add_argument('--reencode-interval', type=float, default=REENCODE_INTERVAL,
+                        help="seconds before a tracked face is re-encoded; 0 encodes every face every frame")
+    parser.add_argument('--motion-sensitivity', type=float, default=MOTION_SENSITIVITY,
+                        help="fraction of changed pixels that triggers detection; 0 detects on every frame")
+    parser.add_argument('--motion-keepalive', type=float, default=MOTION_KEEPALIVE,
+                        help="seconds between forced detections when nothing moves")
+    args = parser.parse_args()
+    main(index=args.index, nprobe=args.nprobe, reencode_interval=args.reencode_interval,
+         motion_sensitivity=args.motion_sensitivity, motion_keepalive=args.motion_keepalive)
+
@@ -0,0 +1,234 @@
+"""Low-overhead runtime metrics with Prometheus text export.
+
+Counters, gauges and fixed-bucket histograms are cheap enough to leave on in
+production (an observation is a bisect and a few additions under a lock).
+Processes without an HTTP server, like the kiosk, periodically write their
+metrics to METRICS_DIR; the Flask app serves its own metrics plus those files
+from /metrics.
+"""
+import bisect
+import glob
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+METRICS_DIR = 'metrics'
+METRICS_EXPORT_INTERVAL = 5.0  # Seconds between metric file writes
+
+# Latency buckets in seconds, from 1 ms to 30 s
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def samples(self, name):
+        yield name + '_total', (), self.value
+
+
+class Gauge:
+    def __init__(self, func=None):
+        self.value = 0
+        self._func = func  # Read lazily at export time, e.g. a queue length
+
+    def set(self, value):
+        self.value = value
+
+    def samples(self, name):
+        value = self._func() if self._func else self.value
+        yield name, (), value
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def samples(self, name):
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += bucket_count
+            yield name + '_bucket', ('le', _format_value(bound)), cumulative
+        yield name + '_sum', (), total
+        yield name + '_count', (), count
+
+
+class MetricFamily:
+    """A named metric, optionally split by label values into child metrics."""
+
+    def __init__(self, name, help_text, kind, labelnames, factory):
+        self.name = name
+        self.help = help_text
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self._factory = factory
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._factory())
+        return child
+
+    def set_function(self, func, *values):
+        """Make a gauge child report func() at export time."""
+        with self._lock:
+            self._children[values] = Gauge(func)
+
+    # Shortcuts for metrics without labels
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in list(self._children.items()):
+            for sample_name, extra, value in child.samples(self.name):
+                labels = _format_labels(self.labelnames, values, extra or None)
+                lines.append(f"{sample_name}{labels} {_format_value(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._families = {}
+        self._lock = threading.Lock()
+
+    def _register(self, name, help_text, kind, labelnames, factory):
+        with self._lock:
+            family = self._families.get(name)
+            if family is None:
+                family = self._families[name] = MetricFamily(name, help_text, kind, labelnames, factory)
+            return family
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(name, help_text, 'counter', labelnames, Counter)
+
+    def gauge(self, name, help_text, labelnames=(), func=None):
+        family = self._register(name, help_text, 'gauge', labelnames, Gauge)
+        if func is not None:
+            family.set_function(func)
+        return family
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(name, help_text, 'histogram', labelnames, lambda: Histogram(buckets))
+
+    def render(self):
+        with self._lock:
+            families = list(self._families.values())
+        lines = []
+        for family in families:
+            try:
+                lines.extend(family.render())
+            except Exception as e:
+                lines.append(f"# error rendering {family.name}: {e}")
+        return '\n'.join(lines) + '\n'
+
+
+# Process-wide default registry
+REGISTRY = Registry()
+
+
+def write_metrics_file(path, registry=REGISTRY):
+    """Atomically write the registry in Prometheus text format."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as file:
+        file.write(registry.render())
+    os.replace(tmp_path, path)
+
+
+def read_metrics_files(directory=METRICS_DIR, max_age=60):
+    """Concatenate recent metric files written by other processes."""
+    texts = []
+    now = time.time()
+    for path in sorted(glob.glob(os.path.join(directory, '*.prom'))):
+        try:
+            if now - os.path.getmtime(path) > max_age:
+                continue  # The process that wrote it is gone
+            with open(path) as file:
+                texts.append(file.read())
+        except OSError:
+            continue
+    return ''.join(texts)
+
+
+class MetricsFileExporter(threading.Thread):
+    """Background thread that writes the registry to a file every few seconds."""
+
+    def __init__(self, path, registry=REGISTRY, interval=METRICS_EXPORT_INTERVAL):
+        super().__init__(name='metrics-exporter', daemon=True)
+        self.path = path
+        self.registry = registry
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                write_metrics_file(self.path, self.registry)
+            except Exception as e:
+                print(f"Failed to export metrics: {e}")
+
+    def stop(self):
+        self._stop_event.set()
+        self.join(timeout=self.interval + 1)
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
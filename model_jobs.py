@@ -0,0 +1,101 @@
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+
+class RebuildQueue:
+    """Background queue that runs model rebuilds one at a time.
+
+    Requests that arrive while a rebuild is already queued are merged into that
+    job, so a burst of enrollments triggers a single rebuild. A request that
+    arrives while a job is running queues exactly one follow-up job, which picks
+    up everything enrolled in the meantime.
+    """
+
+    def __init__(self, rebuild, history=50):
+        self._rebuild = rebuild  # callable returning a stats dict with a 'version' key
+        self._history = history
+        self._cond = threading.Condition()
+        self._jobs = OrderedDict()  # {job id: job record}, oldest first
+        self._queued_id = None
+        self._ids = itertools.count(1)
+        self._thread = threading.Thread(target=self._run, name='model-rebuild', daemon=True)
+        self._thread.start()
+
+    def request(self, reason=None):
+        """Ask for a rebuild and return the id of the job that will perform it."""
+        with self._cond:
+            if self._queued_id is not None:
+                job = self._jobs[self._queued_id]
+                job['merged_requests'] += 1
+                return job['id']
+            job = {
+                'id': next(self._ids),
+                'status': 'queued',
+                'reason': reason,
+                'merged_requests': 1,
+                'queued_at': datetime.now().isoformat(),
+                'started_at': None,
+                'finished_at': None,
+                'duration': None,
+                'version': None,
+                'stats': None,
+                'error': None,
+            }
+            self._jobs[job['id']] = job
+            self._queued_id = job['id']
+            self._trim()
+            self._cond.notify()
+            return job['id']
+
+    def _trim(self):
+        # Drop the oldest finished jobs beyond the history limit
+        finished = [job_id for job_id, job in self._jobs.items()
+                    if job['status'] in ('completed', 'failed')]
+        for job_id in finished[:max(0, len(self._jobs) - self._history)]:
+            del self._jobs[job_id]
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._queued_id is None:
+                    self._cond.wait()
+                job = self._jobs[self._queued_id]
+                self._queued_id = None
+                job['status'] = 'running'
+                job['started_at'] = datetime.now().isoformat()
+
+            start = time.perf_counter()
+            try:
+                stats = self._rebuild() or {}
+                error = None
+            except Exception as e:
+                stats = None
+                error = f"{type(e).__name__}: {e}"
+                print(f"Model rebuild job {job['id']} failed: {error}")
+
+            with self._cond:
+                job['duration'] = round(time.perf_counter() - start, 3)
+                job['finished_at'] = datetime.now().isoformat()
+                job['stats'] = stats
+                job['version'] = stats.get('version') if stats else None
+                job['error'] = error
+                job['status'] = 'failed' if error else 'completed'
+
+    def get(self, job_id):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def status(self):
+        """Return a snapshot of all known jobs grouped by state."""
+        with self._cond:
+            jobs = [dict(job) for job in self._jobs.values()]
+        summary = {'queued': [], 'running': [], 'completed': [], 'failed': []}
+        for job in jobs:
+            summary[job['status']].append(job)
+        completed = [job for job in jobs if job['status'] == 'completed' and job['version']]
+        summary['current_version'] = completed[-1]['version'] if completed else None
+        return summary
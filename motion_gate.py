@@ -0,0 +1,45 @@
+import cv2
+
+MOTION_SENSITIVITY = 0.01  # Fraction of changed pixels that counts as motion
+MOTION_PIXEL_DELTA = 25  # Per-pixel grey level change that counts as "changed"
+MOTION_KEEPALIVE = 5.0  # Seconds between forced detections when nothing moves
+MOTION_FRAME_SIZE = (80, 60)  # Size of the thumbnail that is compared between frames
+
+
+class MotionGate:
+    """Cheap frame-differencing gate in front of face detection.
+
+    Compares a tiny blurred greyscale thumbnail of each preprocessed frame with
+    the previous one. Detection runs when enough pixels changed, when a person
+    is currently being shown, or at least every `keepalive` seconds; every
+    other frame is skipped.
+    """
+
+    def __init__(self, sensitivity=MOTION_SENSITIVITY, pixel_delta=MOTION_PIXEL_DELTA, keepalive=MOTION_KEEPALIVE):
+        self.sensitivity = sensitivity
+        self.pixel_delta = pixel_delta
+        self.keepalive = keepalive
+        self._previous = None
+        self._last_detection = None
+        self.detected = 0
+        self.skipped = 0
+
+    def motion(self, imgS):
+        """Return True if the RGB frame differs enough from the previous one."""
+        gray = cv2.cvtColor(imgS, cv2.COLOR_RGB2GRAY)
+        small = cv2.GaussianBlur(cv2.resize(gray, MOTION_FRAME_SIZE, interpolation=cv2.INTER_AREA), (5, 5), 0)
+        previous, self._previous = self._previous, small
+        if previous is None:
+            return True
+        _, changed = cv2.threshold(cv2.absdiff(small, previous), self.pixel_delta, 255, cv2.THRESH_BINARY)
+        return cv2.countNonZero(changed) >= self.sensitivity * changed.size
+
+    def should_detect(self, imgS, now, person_present=False):
+        moving = self.motion(imgS)
+        keepalive_due = self._last_detection is None or now - self._last_detection >= self.keepalive
+        if moving or person_present or keepalive_due:
+            self._last_detection = now
+            self.detected += 1
+            return True
+        self.skipped += 1
+        return False
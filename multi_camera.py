@@ -0,0 +1,216 @@
+"""Serve several cameras (or video files) from one recognizer process.
+
+All streams share one matcher (hot-reloaded from the encoding store), one
+student cache, one attendance tracker and one pool of recognition worker
+processes. A person walking from one entrance to another therefore keeps a
+single open attendance session.
+
+    python multi_camera.py 0 1 rtsp://door-3/stream --workers 3 --display
+"""
+import argparse
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime
+
+import cv2
+
+import encoding_store
+import image_recognition
+from ann_index import DEFAULT_NPROBE
+from attendance_writer import AttendanceWriter
+from encoding_reloader import MatcherReloader
+from image_recognition import (DATABASE, ENCODING_DISTANCE_THRESHOLD, SCALE_FACTOR, STATS_REPORT_INTERVAL,
+                               AttendanceTracker, CaptureStage, detect_faces, get_student_info, init_worker_process,
+                               load_matcher, load_student_photo, preprocess_image)
+from motion_gate import MOTION_KEEPALIVE, MOTION_SENSITIVITY, MotionGate
+from pipeline import DropOldestQueue, StageStats
+from student_cache import StudentCache
+
+FILE_FRAME_QUEUE_SIZE = 4  # Frames decoded ahead for video files, which are never dropped
+
+
+def open_source(source):
+    """Open a camera index ("0"), stream URL or video file."""
+    cap = cv2.VideoCapture(int(source) if source.isdigit() else source)
+    if source.isdigit():
+        cap.set(3, 640)  # Width
+        cap.set(4, 480)  # Height
+    return cap
+
+
+class Stream:
+    """Per-camera state: capture thread, newest frame, motion gate and in-flight job."""
+
+    def __init__(self, index, source, motion_sensitivity, motion_keepalive):
+        self.name = f"camera {index} ({source})"
+        self.cap = open_source(source)
+        self.stop_event = threading.Event()
+        if os.path.isfile(source):
+            # Video files decode far faster than real time; wait for the scheduler instead
+            # of dropping frames, so every frame is processed and results don't depend on timing
+            self.frames = DropOldestQueue(FILE_FRAME_QUEUE_SIZE, block=True)
+        else:
+            self.frames = DropOldestQueue(1)
+        self.capture = CaptureStage(self.cap, self.frames, self.stop_event, name=f"capture {index}")
+        self.motion_gate = (MotionGate(motion_sensitivity, keepalive=motion_keepalive)
+                            if motion_sensitivity > 0 else None)
+        self.stats = StageStats(f"recognition {index}")
+        self.job = None  # Future of the frame currently being processed
+        self.frame = None  # Frame the job belongs to
+        self.faces = []  # [(box, student_id, distance)] from the last processed frame
+
+    @property
+    def finished(self):
+        return self.stop_event.is_set() and self.job is None and not len(self.frames)
+
+
+def _schedule(streams, pool, workers, start):
+    """Submit frames round-robin, at most one in-flight job per stream and `workers` in total.
+
+    Returns the stream index to start from next time so no camera is starved.
+    """
+    in_flight = sum(1 for stream in streams if stream.job is not None)
+    for offset in range(len(streams)):
+        if in_flight >= workers:
+            break
+        position = (start + offset) % len(streams)
+        stream = streams[position]
+        if stream.job is not None:
+            continue
+        frame = stream.frames.get(timeout=0)
+        if frame is None:
+            continue
+        imgS = preprocess_image(frame[2], SCALE_FACTOR)
+        person_present = bool(stream.faces)
+        if stream.motion_gate and not stream.motion_gate.should_detect(imgS, time.monotonic(), person_present):
+            stream.faces = []
+            stream.stats.tick()
+            continue
+        stream.frame = frame
+        stream.job = pool.submit(detect_faces, imgS)
+        in_flight += 1
+        start = position + 1
+    return start % len(streams)
+
+
+def _collect(streams, matcher, tracker):
+    """Match the faces of every finished job in one batch and update shared attendance."""
+    finished = [stream for stream in streams if stream.job is not None and stream.job.done()]
+    if not finished:
+        return []
+    detections = []
+    for stream in finished:
+        try:
+            locations, encodings = stream.job.result()
+        except Exception as e:
+            print(f"Recognition failed for {stream.name}: {e}")
+            locations, encodings = [], []
+        detections.append((stream, locations, encodings))
+        stream.job = None
+
+    all_encodings = [encoding for _, _, encodings in detections for encoding in encodings]
+    matches = matcher.best(all_encodings, ENCODING_DISTANCE_THRESHOLD)
+    tracker.update(matches, datetime.now())
+
+    position = 0
+    for stream, locations, encodings in detections:
+        stream_matches = matches[position:position + len(encodings)]
+        position += len(encodings)
+        stream.faces = [(box, student_id, distance) for box, (student_id, distance) in zip(locations, stream_matches)]
+        stream.stats.tick()
+    return finished
+
+
+def _render(stream, student_cache):
+    """Show the camera frame with a labelled box around each face."""
+    img = stream.frame[2].copy()
+    for (top, right, bottom, left), student_id, distance in stream.faces:
+        top, right, bottom, left = (int(v / SCALE_FACTOR) for v in (top, right, bottom, left))
+        info = student_cache.get_info(student_id) if student_id is not None else None
+        label = f"{info['name']} ({distance:.2f})" if info else "Unknown"
+        color = (0, 200, 0) if info else (0, 0, 255)
+        cv2.rectangle(img, (left, top), (right, bottom), color, 2)
+        cv2.putText(img, label, (left, max(top - 10, 20)), cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
+    cv2.imshow(stream.name, img)
+
+
+def main(sources, workers, index='exact', nprobe=DEFAULT_NPROBE, display=False,
+         motion_sensitivity=MOTION_SENSITIVITY, motion_keepalive=MOTION_KEEPALIVE):
+    image_recognition.attendance_writer = AttendanceWriter(DATABASE)
+    reloader = MatcherReloader(lambda: load_matcher(encoding_store.STORE_DIR, index, nprobe))
+    IMAGES_FOLDER = os.path.join('static', 'Images')  # Ensure this path matches Flask's UPLOAD_FOLDER
+    student_cache = StudentCache(get_student_info, lambda student_id: load_student_photo(student_id, IMAGES_FOLDER))
+    # One tracker for all cameras, so attendance is logged once per person
+    tracker = AttendanceTracker(student_cache)
+    cached_version_dir = reloader.version_dir
+
+    streams = [Stream(i, source, motion_sensitivity, motion_keepalive) for i, source in enumerate(sources)]
+    for stream in streams:
+        stream.capture.start()
+
+    print(f"Serving {len(streams)} streams with {workers} recognition workers. "
+          f"{'Press q to quit.' if display else 'Press Ctrl+C to quit.'}")
+    next_stream = 0
+    next_report = time.monotonic() + STATS_REPORT_INTERVAL
+    # 'spawn' so workers don't inherit the capture threads' state through fork
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                               initializer=init_worker_process)
+    try:
+        while not all(stream.finished for stream in streams):
+            # One read, so the caches are reset for exactly the version matched against below
+            version_dir, matcher = reloader.current
+            if version_dir != cached_version_dir:
+                student_cache.clear()
+                cached_version_dir = version_dir
+
+            next_stream = _schedule(streams, pool, workers, next_stream)
+            jobs = [stream.job for stream in streams if stream.job is not None]
+            if jobs:
+                wait(jobs, timeout=0.05, return_when=FIRST_COMPLETED)
+            else:
+                time.sleep(0.005)
+            finished = _collect(streams, matcher, tracker)
+
+            if display:
+                for stream in finished:
+                    _render(stream, student_cache)
+                if cv2.waitKey(1) == ord('q'):
+                    break
+
+            if time.monotonic() >= next_report:
+                for stream in streams:
+                    gate = f", {stream.motion_gate.skipped} skipped by motion gate" if stream.motion_gate else ""
+                    print(f"{stream.name}: {stream.capture.stats}, {stream.stats} "
+                          f"({stream.frames.dropped} frames dropped{gate})")
+                next_report = time.monotonic() + STATS_REPORT_INTERVAL
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for stream in streams:
+            stream.stop_event.set()
+            stream.frames.close()
+            stream.capture.join()
+            stream.cap.release()
+        pool.shutdown(wait=True, cancel_futures=True)
+        image_recognition.attendance_writer.close()
+        reloader.stop()
+        if display:
+            cv2.destroyAllWindows()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Face recognition for several cameras in one process")
+    parser.add_argument('sources', nargs='+', help="camera indexes, stream URLs or video files")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="recognition worker processes shared by all streams")
+    parser.add_argument('--index', choices=['exact', 'ivf'], default='exact')
+    parser.add_argument('--nprobe', type=int, default=DEFAULT_NPROBE)
+    parser.add_argument('--display', action='store_true', help="show one window per stream")
+    parser.add_argument('--motion-sensitivity', type=float, default=MOTION_SENSITIVITY)
+    parser.add_argument('--motion-keepalive', type=float, default=MOTION_KEEPALIVE)
+    args = parser.parse_args()
+    main(args.sources, args.workers, index=args.index, nprobe=args.nprobe, display=args.display,
+         motion_sensitivity=args.motion_sensitivity, motion_keepalive=args.motion_keepalive)
@@ -0,0 +1,122 @@
+import threading
+import time
+from collections import deque
+
+STATS_WINDOW = 5.0  # Seconds of history used for the throughput figures
+
+
+class DropOldestQueue:
+    """Bounded queue that discards the oldest item instead of blocking the producer.
+
+    Consumers always get the freshest data; a slow consumer never makes a fast
+    producer (e.g. the camera) fall behind. With `block=True` the producer
+    waits for space instead, for sources like video files where every frame
+    should be processed; close() releases a waiting producer at shutdown.
+    """
+
+    def __init__(self, maxsize=1, block=False):
+        self.maxsize = maxsize
+        self.block = block
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self.dropped = 0
+
+    def put(self, item):
+        with self._cond:
+            if self.block:
+                self._cond.wait_for(lambda: len(self._items) < self.maxsize or self._closed)
+                if self._closed:
+                    return
+            elif len(self._items) >= self.maxsize:
+                self._items.popleft()
+                self.dropped += 1
+            self._items.append(item)
+            self._cond.notify_all()
+
+    def get(self, timeout=None):
+        """Remove and return the oldest item; returns None on timeout."""
+        with self._cond:
+            if not self._items and not self._cond.wait_for(lambda: self._items, timeout):
+                return None
+            item = self._items.popleft()
+            self._cond.notify_all()  # Wake a producer waiting for space
+            return item
+
+    def get_latest(self, timeout=None):
+        """Remove and return the newest item, dropping older ones; returns None on timeout."""
+        with self._cond:
+            if not self._items and not self._cond.wait_for(lambda: self._items, timeout):
+                return None
+            item = self._items.pop()
+            self.dropped += len(self._items)
+            self._items.clear()
+            self._cond.notify_all()
+            return item
+
+    def close(self):
+        """Stop accepting items and release a producer blocked in put()."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def peek_latest(self):
+        """Return the newest item without removing it, or None if empty."""
+        with self._cond:
+            return self._items[-1] if self._items else None
+
+    def __len__(self):
+        return len(self._items)
+
+
+class StageStats:
+    """Throughput counter for one pipeline stage."""
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self._times = deque()
+        self._lock = threading.Lock()
+
+    def tick(self):
+        now = time.monotonic()
+        with self._lock:
+            self.count += 1
+            self._times.append(now)
+            while self._times and now - self._times[0] > STATS_WINDOW:
+                self._times.popleft()
+
+    def fps(self):
+        now = time.monotonic()
+        with self._lock:
+            while self._times and now - self._times[0] > STATS_WINDOW:
+                self._times.popleft()
+            if len(self._times) < 2:
+                return 0.0
+            return (len(self._times) - 1) / max(now - self._times[0], 1e-6)
+
+    def __str__(self):
+        return f"{self.name} {self.fps():.1f} fps"
+
+
+class Stage(threading.Thread):
+    """A pipeline thread that calls `step()` until stopped or `step()` returns False."""
+
+    def __init__(self, name, stop_event):
+        super().__init__(name=name, daemon=True)
+        self.stop_event = stop_event
+        self.stats = StageStats(name)
+
+    def step(self):
+        raise NotImplementedError
+
+    def run(self):
+        try:
+            while not self.stop_event.is_set():
+                if self.step() is False:
+                    break
+        except Exception as e:
+            print(f"{self.name} stage failed: {type(e).__name__}: {e}")
+        finally:
+            # One stage ending shuts the whole pipeline down
+            self.stop_event.set()
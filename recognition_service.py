@@ -0,0 +1,151 @@
+"""Micro-batched face recognition for the Flask app's /recognize endpoint.
+
+Request threads decode and resize their images and hand them to a single
+batcher thread. The batcher collects the images from concurrent requests
+until RECOGNIZE_MAX_BATCH images are waiting or RECOGNIZE_MAX_WAIT seconds
+have passed, detects and encodes them across a process pool, and matches
+every face of the batch against the gallery in one call.
+"""
+import math
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import cv2
+import face_recognition
+import numpy as np
+
+import encoding_store
+from encoding_reloader import MatcherReloader
+from image_recognition import ENCODING_DISTANCE_THRESHOLD, init_worker_process, load_matcher
+
+RECOGNIZE_MAX_BATCH = int(os.environ.get('RECOGNIZE_MAX_BATCH', 16))  # Images per micro-batch
+RECOGNIZE_MAX_WAIT = float(os.environ.get('RECOGNIZE_MAX_WAIT', 0.01))  # Seconds to wait for a batch to fill
+RECOGNIZE_WORKERS = int(os.environ.get('RECOGNIZE_WORKERS', os.cpu_count() or 1))  # Detection processes
+RECOGNIZE_MAX_SIDE = 1024  # Larger images are downscaled before detection
+
+
+def prepare_image(data, max_side=RECOGNIZE_MAX_SIDE):
+    """Decode image bytes into an RGB array no larger than max_side; returns (image, scale) or None."""
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+    scale = min(1.0, max_side / max(img.shape[:2]))
+    if scale < 1.0:
+        img = cv2.resize(img, (0, 0), fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB), scale
+
+
+def detect_and_encode(img_rgb):
+    """Face locations, encodings and an error message (or None) for one RGB image."""
+    try:
+        # Images are already up to RECOGNIZE_MAX_SIDE; upsampling would double that for HOG
+        locations = face_recognition.face_locations(img_rgb, number_of_times_to_upsample=0, model='hog')
+        return locations, face_recognition.face_encodings(img_rgb, locations), None
+    except Exception as e:
+        # Reported for this image only; the rest of the batch still completes
+        return [], [], f"{type(e).__name__}: {e}"
+
+
+class RecognitionService:
+    """Collects images from concurrent requests into micro-batches.
+
+    `submit()` returns a Future that resolves to a list of faces, each a dict
+    with the box (in the submitted image's coordinates), the matched
+    student_id (None if unknown) and the distance.
+    """
+
+    def __init__(self, reloader, max_batch=RECOGNIZE_MAX_BATCH, max_wait=RECOGNIZE_MAX_WAIT,
+                 workers=RECOGNIZE_WORKERS, threshold=ENCODING_DISTANCE_THRESHOLD):
+        self.reloader = reloader
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait
+        self.workers = max(1, workers)
+        self.threshold = threshold
+        self.batches = 0
+        self.images = 0
+        self._queue = queue.Queue()
+        self._executor = None
+        self._thread = threading.Thread(target=self._run, name='recognition-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, img_rgb, scale=1.0):
+        future = Future()
+        self._queue.put((img_rgb, scale, future))
+        return future
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        # The first image waits at most max_wait for others to join its batch
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _detect(self, images):
+        if self.workers == 1:
+            # dlib holds the GIL, so in-process detection stalls every Flask request thread;
+            # only done when explicitly configured with a single worker
+            return [detect_and_encode(img) for img in images]
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker_process)
+        try:
+            return list(self._executor.map(detect_and_encode, images))
+        except BrokenProcessPool:
+            # A worker died; this batch fails, the next one gets a fresh pool
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            raise
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                detections = self._detect([img for img, _, _ in batch])
+                matcher = self.reloader.matcher
+                all_encodings = [encoding for _, encodings, _ in detections for encoding in encodings]
+                if matcher is None:
+                    matches = [(None, None)] * len(all_encodings)
+                else:
+                    # Every face of every image in the batch, matched in one call
+                    matches = matcher.best(all_encodings, self.threshold)
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            position = 0
+            for (_, scale, future), (locations, encodings, error) in zip(batch, detections):
+                if error is not None:
+                    future.set_exception(RuntimeError(error))
+                    continue
+                faces = []
+                for (top, right, bottom, left), (student_id, distance) in zip(
+                        locations, matches[position:position + len(encodings)]):
+                    # An empty gallery gives no distance (inf is not valid JSON)
+                    finite = distance is not None and math.isfinite(distance)
+                    faces.append({
+                        'student_id': None if student_id is None else int(student_id),
+                        'distance': round(float(distance), 4) if finite else None,
+                        'box': {'top': int(top / scale), 'right': int(right / scale),
+                                'bottom': int(bottom / scale), 'left': int(left / scale)},
+                    })
+                position += len(encodings)
+                future.set_result(faces)
+            self.batches += 1
+            self.images += len(batch)
+
+
+def create_service(store_dir=encoding_store.STORE_DIR):
+    """A RecognitionService whose gallery follows new encoding store versions."""
+    # Same loader as the kiosk, but no encodings yet (before the first rebuild) is not fatal
+    return RecognitionService(MatcherReloader(lambda: load_matcher(store_dir, required=False), store_dir))
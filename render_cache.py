@@ -0,0 +1,55 @@
+from collections import OrderedDict
+
+import numpy as np
+
+RENDER_CACHE_SIZE = 8  # Composed frames kept, e.g. the idle screen, "unknown" and recent students
+
+
+class RenderCache:
+    """Composed display frames keyed by what is shown on them.
+
+    The display only changes when the shown student, the recognised/unknown
+    status or the display timeout changes, so each distinct state is composed
+    once into a preallocated buffer and reused on every later frame. Buffers
+    of evicted states are recycled, so steady-state rendering allocates
+    nothing.
+    """
+
+    def __init__(self, background, max_entries=RENDER_CACHE_SIZE):
+        self.background = background
+        self.max_entries = max(1, max_entries)
+        self._frames = OrderedDict()  # {key: (frame buffer, objects the key refers to by id)}
+        self._last_key = None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, draw=None, keep=None):
+        """Return (frame, changed) for the state `key`.
+
+        On a miss the frame is reset to the background and `draw(frame)` is
+        called to compose it. `keep` holds a reference to objects whose id() is
+        part of the key (such as the student photo) so the id can't be reused
+        while the frame is cached. `changed` is False when the previous call
+        returned the same frame, so the caller can skip showing it again.
+        """
+        entry = self._frames.get(key)
+        if entry is not None:
+            self._frames.move_to_end(key)
+            self.hits += 1
+        else:
+            self.misses += 1
+            if len(self._frames) >= self.max_entries:
+                _, (frame, _) = self._frames.popitem(last=False)
+            else:
+                frame = np.empty_like(self.background)
+            np.copyto(frame, self.background)
+            if draw is not None:
+                draw(frame)
+            entry = self._frames[key] = (frame, keep)
+        changed = key != self._last_key
+        self._last_key = key
+        return entry[0], changed
+
+    def clear(self):
+        self._frames.clear()
+        self._last_key = None
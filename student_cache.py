@@ -0,0 +1,76 @@
+import threading
+import time
+from collections import OrderedDict
+
+STUDENT_CACHE_SIZE = 64  # Students kept in memory (each holds a 300x300 photo, ~270 KB)
+STUDENT_CACHE_TTL = 300  # Seconds before a cached row and photo are re-read from disk
+STUDENT_CACHE_MISSING_TTL = 5  # Shorter lifetime for lookups that found nothing (or failed)
+
+
+class StudentCache:
+    """Bounded LRU cache of student rows and ready-to-blit profile photos.
+
+    Entries expire after `ttl` seconds so edits made through the Flask app show
+    up eventually; `clear()` drops everything immediately (e.g. after a new
+    encoding version is loaded). Missing students are cached as well, so an
+    unknown ID does not hit the database on every frame.
+    """
+
+    def __init__(self, load_info, load_photo, max_entries=STUDENT_CACHE_SIZE, ttl=STUDENT_CACHE_TTL):
+        self._load_info = load_info  # callable(student_id) -> dict or None
+        self._load_photo = load_photo  # callable(student_id) -> image or None
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # {student_id: [expires_at, info, photo, photo_loaded]}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _entry(self, student_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(student_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(student_id)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        # Load outside the lock so other threads are not held up by disk I/O
+        info = self._load_info(student_id)
+        ttl = self.ttl if info else min(self.ttl, STUDENT_CACHE_MISSING_TTL)
+        entry = [now + ttl, info, None, False]
+        with self._lock:
+            self._entries[student_id] = entry
+            self._entries.move_to_end(student_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def get_info(self, student_id):
+        return self._entry(student_id)[1]
+
+    def get_photo(self, student_id):
+        """Return the resized profile photo; loaded on first use and then reused."""
+        entry = self._entry(student_id)
+        if not entry[3]:
+            entry[2] = self._load_photo(student_id) if entry[1] else None
+            entry[3] = True
+        return entry[2]
+
+    def invalidate(self, student_id):
+        with self._lock:
+            self._entries.pop(student_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }